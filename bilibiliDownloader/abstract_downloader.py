@@ -1,5 +1,17 @@
 """
 下载器抽象基类，定义统一接口
+
+除download_video和stop_download外，下载管理器和下载器工厂还会使用以下可选接口，
+基类提供默认值，子类按需实现:
+- download_streams: 只下载音视频流，合并交给下载管理器的后期处理阶段
+- cancellation_event: 取消令牌，分块之间检查
+- bandwidth_limiter: 全局带宽限制器，limits_bandwidth为True时由下载器在读取数据时调用
+- stage_callback: 元数据解析完成时的回调
+- video_info / play_info: 已缓存的视频信息和视频流地址，设置后不必重新请求接口
+- resume: 重试时是否续传已下载的部分
+- session / strategy: 共享的HTTP会话和单个流的下载策略
+- content_store: 已下载流的本地内容存储(content_store.ContentStore)
+- total_size / digests: 下载的总大小和下载时计算的流摘要
 """
 import abc
 from typing import Dict, Optional, Callable
@@ -7,17 +19,47 @@ from typing import Dict, Optional, Callable
 class AbstractDownloader(abc.ABC):
     """下载器抽象基类"""
     
+    # 是否在读取数据时自行调用bandwidth_limiter限速，为False时下载管理器在进度回调中限速
+    limits_bandwidth = False
+    
     def __init__(self, progress_callback: Optional[Callable] = None):
         """初始化下载器"""
         self.progress_callback = progress_callback
         self.is_downloading = False
-        self.cancellation_event = None  # 子类实现
+        self.cancellation_event = None  # 取消令牌(CancellationToken)，由下载管理器在每个任务开始时设置
+        self.bandwidth_limiter = None  # 全局带宽限制器(BandwidthLimiter)
+        self.stage_callback = None  # 阶段回调，参数为阶段名称，解析完元数据时以"metadata"调用
+        self.video_info = None  # 已解析的视频信息，不为None时不必请求视频信息接口
+        self.play_info = None  # 已获取的playurl接口数据，不为None时不必请求playurl接口
+        self.resume = False  # 是否续传上次未完成的下载
+        self.session = None  # HTTP会话，None表示使用全局共享会话
+        self.strategy = None  # 单个流的下载策略(single/segmented)，None表示按流的大小选择
+        self.content_store = None  # 已下载流的内容存储，None表示不使用
+        self.total_size = 0  # 下载的总字节数，用于计算进度
+        self.digests = None  # 各个流下载时计算的摘要，键为video和audio
         
     @abc.abstractmethod
     def download_video(self, url: str, save_dir: str, quality: str) -> Dict:
         """下载视频的抽象方法"""
         pass
         
+    def download_streams(self, url: str, save_dir: str, quality: str) -> Dict:
+        """
+        只下载音视频流，不合并
+        
+        默认直接下载完整视频；子类支持分阶段下载时返回post_processor.process_streams的参数，
+        并设置needs_merge为True
+        
+        Args:
+            url: 视频地址
+            save_dir: 保存目录
+            quality: 画质
+            
+        Returns:
+            Dict: 下载结果或待合并的流信息
+        """
+        return self.download_video(url, save_dir, quality)
+        
     @abc.abstractmethod
     def stop_download(self):
         """停止下载的抽象方法"""
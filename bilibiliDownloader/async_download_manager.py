@@ -0,0 +1,175 @@
+"""
+下载管理器的asyncio接口，供嵌入asyncio服务使用
+
+下载仍由DownloadManager的工作线程执行，本模块只负责桥接:
+- 可能阻塞的调用(添加、取消任务)放到线程池中执行，不阻塞事件循环
+- 工作线程上的状态回调通过call_soon_threadsafe投递到事件循环
+- 等待任务结束使用Future，一个事件循环可以同时跟踪成千上万个任务
+"""
+import asyncio
+import functools
+from collections import defaultdict, namedtuple
+from typing import AsyncIterator, List, Optional, Tuple
+
+from download_manager import DownloadManager, DownloadTask, download_manager as default_manager
+
+# 状态事件
+StatusEvent = namedtuple("StatusEvent", ["task_id", "status", "progress", "result", "error"])
+
+# 任务结束的状态
+TERMINAL_STATUSES = ("completed", "failed", "canceled")
+
+class AsyncDownloadManager:
+    """下载管理器的asyncio接口"""
+
+    def __init__(self, manager: Optional[DownloadManager] = None, event_queue_size: int = 0):
+        """
+        初始化asyncio接口
+
+        Args:
+            manager: 下载管理器，默认使用全局下载管理器
+            event_queue_size: 每个事件订阅者的队列长度，0表示不限制；队列满时丢弃最旧的事件
+        """
+        self.manager = manager or default_manager
+        self.event_queue_size = event_queue_size
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._waiters = defaultdict(list)  # task_id -> 等待任务结束的Future
+        self._subscribers = set()  # 事件订阅者的队列
+        self.manager.add_status_listener(self._on_status)
+        # 监听器就绪后再恢复任务日志中的任务，恢复的任务的状态变化也会被通知
+        self.manager.start()
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        """绑定当前运行的事件循环"""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        return self._loop
+
+    async def add_task(self, url: str, save_dir: str, quality: str, **kwargs) -> str:
+        """
+        添加下载任务
+
+        Args:
+            url: 视频地址
+            save_dir: 保存目录
+            quality: 画质
+            **kwargs: 传给DownloadManager.add_task的其他参数
+
+        Returns:
+            str: 任务ID
+        """
+        loop = self._bind_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self.manager.add_task, url, save_dir, quality, **kwargs)
+        )
+
+    async def submit_task(self, url: str, save_dir: str, quality: str, **kwargs) -> Tuple[str, bool]:
+        """
+        添加下载任务，并返回是否被去重，参数同add_task
+
+        Returns:
+            Tuple[str, bool]: (任务ID, 是否为已有任务)
+        """
+        loop = self._bind_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self.manager.submit_task, url, save_dir, quality, **kwargs)
+        )
+
+    async def add_batch(self, url: str, save_dir: str, quality: str, **kwargs) -> Tuple[str, List[str]]:
+        """
+        把多P视频、合集或收藏夹展开为一组下载任务，参数同DownloadManager.add_batch
+
+        Returns:
+            Tuple[str, List[str]]: (任务组ID, 任务ID列表)
+        """
+        loop = self._bind_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self.manager.add_batch, url, save_dir, quality, **kwargs)
+        )
+
+    async def cancel(self, task_id: str) -> bool:
+        """
+        取消下载任务
+
+        Args:
+            task_id: 任务ID
+
+        Returns:
+            bool: 任务是否存在且尚未结束
+        """
+        loop = self._bind_loop()
+        return await loop.run_in_executor(None, self.manager.cancel_task, task_id)
+
+    async def wait_for(self, task_id: str, timeout: Optional[float] = None) -> DownloadTask:
+        """
+        等待任务结束(完成、失败或取消)
+
+        Args:
+            task_id: 任务ID
+            timeout: 超时时间（秒），None表示一直等待
+
+        Returns:
+            DownloadTask: 结束的任务，可通过status、result和error查看结果
+        """
+        self._bind_loop()
+        task = self.manager.get_task(task_id)
+        if task is None:
+            raise KeyError(f"任务不存在: {task_id}")
+        if task.status in TERMINAL_STATUSES:
+            return task
+
+        future = self._loop.create_future()
+        self._waiters[task_id].append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        finally:
+            waiters = self._waiters.get(task_id)
+            if waiters and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._waiters[task_id]
+        return self.manager.get_task(task_id) or task
+
+    async def events(self) -> AsyncIterator[StatusEvent]:
+        """
+        异步迭代所有任务的状态事件
+
+        Yields:
+            StatusEvent: 状态事件
+        """
+        self._bind_loop()
+        queue = asyncio.Queue(self.event_queue_size)
+        self._subscribers.add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers.discard(queue)
+
+    def close(self):
+        """停止接收状态事件"""
+        self.manager.remove_status_listener(self._on_status)
+
+    def _on_status(self, task_id: str, status: str, progress: int, result=None, error=None):
+        """状态监听器，在工作线程上调用"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        event = StatusEvent(task_id, status, progress, result, error)
+        try:
+            loop.call_soon_threadsafe(self._dispatch, event)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    def _dispatch(self, event: StatusEvent):
+        """在事件循环中分发状态事件"""
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+        if event.status in TERMINAL_STATUSES:
+            for future in self._waiters.pop(event.task_id, []):
+                if not future.done():
+                    future.set_result(event)
@@ -0,0 +1,337 @@
+"""
+B站元数据接口，用于把多P视频、合集和收藏夹展开为多个下载任务
+
+- 所有请求使用共享HTTP会话，响应按请求参数缓存到cache_manager
+- 分页接口先请求第一页获得总数，其余页面并发请求
+- 视频信息缓存在 video_info:<视频ID> 键下，同一视频的各个分P共用一次请求的结果
+- 视频流地址(playurl)带签名和到期时间(deadline参数)，缓存有效期按最早到期的地址计算，
+  下载管理器可以提前为等待中的任务解析，任务开始时直接下载
+"""
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from cache_manager import cache_manager
+from config import BILIBILI_API
+from error_handler import HTTPStatusError
+from http_session import get_session
+from input_validator import extract_video_details
+from logger import logger
+from utils import extract_video_id
+
+# 分页并发请求数
+PAGE_WORKERS = 4
+
+# 接口被风控拦截时返回的错误码
+API_CODE_RISK_CONTROL = -412
+
+# 视频流地址到期前多久视为失效（秒），留出下载开始前的时间
+PLAYURL_EXPIRY_MARGIN = 300
+
+# 视频流地址不带到期时间时的缓存有效期（秒）
+PLAYURL_DEFAULT_TTL = 600
+
+# 请求DASH格式的全部流(HDR、4K、杜比、8K、AV1)
+PLAYURL_FNVAL = 4048
+
+# 每页条数(接口允许的最大值)
+FAVORITES_PAGE_SIZE = 20
+SEASON_PAGE_SIZE = 30
+
+def _get_json(url: str, params: Dict, cache_key: Optional[str] = None) -> Dict:
+    """
+    请求B站接口并返回data字段，结果写入缓存
+
+    Args:
+        url: 接口地址
+        params: 请求参数
+        cache_key: 缓存键，默认由地址和参数生成
+
+    Returns:
+        Dict: 接口返回的data
+    """
+    if cache_key is None:
+        cache_key = f"api:{url}?{urlencode(sorted(params.items()))}"
+    cached = cache_manager.get(cache_key)
+    if cached is not None:
+        return cached
+
+    data = _request_json(url, params)
+    cache_manager.set(cache_key, data)
+    return data
+
+def _request_json(url: str, params: Dict) -> Dict:
+    """请求B站接口并返回data字段，不使用缓存"""
+    response = get_session().get(url, params=params, timeout=10)
+    response.raise_for_status()
+    payload = response.json()
+    if payload.get("code") != 0:
+        message = f"B站接口返回错误: {payload.get('code')} {payload.get('message', '')}"
+        if payload.get("code") == API_CODE_RISK_CONTROL:
+            # HTTP状态为200，但与412相同表示请求被风控拦截
+            raise HTTPStatusError(message, 412)
+        raise Exception(message)
+    return payload.get("data") or {}
+
+def _fetch_pages(fetch_page: Callable[[int], Dict], total_pages: int, first_page: Dict) -> List[Dict]:
+    """
+    并发请求第2页到最后一页
+
+    Args:
+        fetch_page: 请求指定页码的函数
+        total_pages: 总页数
+        first_page: 已请求的第一页
+
+    Returns:
+        List[Dict]: 按页码排列的所有页面
+    """
+    if total_pages <= 1:
+        return [first_page]
+    with ThreadPoolExecutor(max_workers=min(PAGE_WORKERS, total_pages - 1)) as executor:
+        rest = list(executor.map(fetch_page, range(2, total_pages + 1)))
+    return [first_page] + rest
+
+def video_info_cache_key(video_id: str) -> str:
+    """视频信息的缓存键，下载器可用同一个键读取已解析的视频信息"""
+    return f"video_info:{video_id}"
+
+def get_video_info(video_id: str) -> Dict:
+    """
+    获取视频信息(标题、分P、所属合集等)
+
+    按传入的ID缓存，同时按BV号缓存，av号链接展开的任务(按BV号查找)也能命中
+
+    Args:
+        video_id: BV号或av号
+
+    Returns:
+        Dict: 视频信息接口返回的data
+    """
+    details = extract_video_details(video_id)
+    if details is None:
+        raise ValueError(f"无效的视频ID: {video_id}")
+    params = {details["id_type"]: details["id"]}
+    info = _get_json(BILIBILI_API["video_info"], params, cache_key=video_info_cache_key(video_id))
+    bvid = info.get("bvid")
+    if bvid and bvid != video_id:
+        canonical_key = video_info_cache_key(bvid)
+        if cache_manager.get(canonical_key) is None:
+            cache_manager.set(canonical_key, info)
+    return info
+
+def playurl_cache_key(bvid: str, cid, quality_code: int) -> str:
+    """视频流地址的缓存键"""
+    return f"playurl:{bvid}:{cid}:{quality_code}"
+
+def _stream_urls(data: Dict) -> List[str]:
+    """playurl返回的所有流地址(包括备用地址)"""
+    urls = []
+    dash = data.get("dash") or {}
+    for stream in (dash.get("video") or []) + (dash.get("audio") or []):
+        urls.append(stream.get("base_url") or stream.get("baseUrl"))
+        urls.extend(stream.get("backup_url") or stream.get("backupUrl") or [])
+    for segment in data.get("durl") or []:
+        urls.append(segment.get("url"))
+        urls.extend(segment.get("backup_url") or [])
+    return [url for url in urls if url]
+
+def playurl_ttl(data: Dict) -> float:
+    """
+    视频流地址的缓存有效期: 距最早到期的地址的deadline，减去PLAYURL_EXPIRY_MARGIN
+
+    Args:
+        data: playurl接口返回的data
+
+    Returns:
+        float: 有效期（秒），地址已接近到期时不大于0
+    """
+    deadlines = []
+    for url in _stream_urls(data):
+        deadline = parse_qs(urlparse(url).query).get("deadline", [None])[0]
+        if deadline and deadline.isdigit():
+            deadlines.append(int(deadline))
+    if not deadlines:
+        return PLAYURL_DEFAULT_TTL
+    return min(deadlines) - time.time() - PLAYURL_EXPIRY_MARGIN
+
+def get_play_url(bvid: str, cid, quality_code: int) -> Dict:
+    """
+    获取视频流地址，缓存到地址到期前
+
+    Args:
+        bvid: BV号
+        cid: 分P的cid
+        quality_code: 画质代码
+
+    Returns:
+        Dict: playurl接口返回的data
+    """
+    cache_key = playurl_cache_key(bvid, cid, quality_code)
+    cached = cache_manager.get(cache_key)
+    if cached is not None:
+        return cached
+
+    data = _request_json(BILIBILI_API["video_stream"], {
+        "bvid": bvid, "cid": cid, "qn": quality_code, "fnval": PLAYURL_FNVAL, "fourk": 1
+    })
+    ttl = playurl_ttl(data)
+    if ttl > 0:
+        cache_manager.set(cache_key, data, ttl=ttl)
+    return data
+
+def prefetch_video(url: str, quality_code: int) -> Dict[str, str]:
+    """
+    解析视频信息和视频流地址并写入缓存，供下载器直接使用
+
+    Args:
+        url: 视频链接(可带p参数)
+        quality_code: 画质代码
+
+    Returns:
+        Dict[str, str]: metadata_key(视频信息的缓存键)和playurl_key(视频流地址的缓存键)
+    """
+    video_id = extract_video_id(url)
+    if video_id is None:
+        raise ValueError(f"无法识别的链接: {url}")
+    info = get_video_info(video_id)
+    bvid = info.get("bvid", video_id)
+    page = int(parse_qs(urlparse(url).query).get("p", ["1"])[0])
+    pages = info.get("pages") or []
+    cid = pages[page - 1].get("cid") if 0 < page <= len(pages) else info.get("cid")
+    if cid is None:
+        raise ValueError(f"视频{video_id}没有第{page}P")
+    get_play_url(bvid, cid, quality_code)
+    return {"metadata_key": video_info_cache_key(bvid),
+            "playurl_key": playurl_cache_key(bvid, cid, quality_code)}
+
+def get_season_videos(mid: str, season_id: str) -> List[Dict]:
+    """
+    获取合集中的所有视频
+
+    Args:
+        mid: UP主ID
+        season_id: 合集ID
+
+    Returns:
+        List[Dict]: 合集中的视频，按合集顺序排列
+    """
+    def fetch_page(page_num: int) -> Dict:
+        return _get_json(BILIBILI_API["season_archives"], {
+            "mid": mid, "season_id": season_id, "page_num": page_num, "page_size": SEASON_PAGE_SIZE
+        })
+
+    first = fetch_page(1)
+    total = first.get("page", {}).get("total", 0)
+    pages = _fetch_pages(fetch_page, -(-total // SEASON_PAGE_SIZE), first)
+    return [archive for page in pages for archive in page.get("archives") or []]
+
+def get_favorite_videos(media_id: str) -> List[Dict]:
+    """
+    获取收藏夹中的所有视频，已失效的视频会被跳过
+
+    Args:
+        media_id: 收藏夹ID
+
+    Returns:
+        List[Dict]: 收藏夹中的视频，按收藏顺序排列
+    """
+    def fetch_page(pn: int) -> Dict:
+        return _get_json(BILIBILI_API["favorites"], {
+            "media_id": media_id, "pn": pn, "ps": FAVORITES_PAGE_SIZE, "platform": "web"
+        })
+
+    first = fetch_page(1)
+    total = (first.get("info") or {}).get("media_count", 0)
+    pages = _fetch_pages(fetch_page, -(-total // FAVORITES_PAGE_SIZE), first)
+    # type为2的是视频，attr非0表示已失效
+    return [media for page in pages for media in page.get("medias") or []
+            if media.get("type") == 2 and not media.get("attr")]
+
+def _video_entry(bvid: str, title: str, page: Optional[int] = None, cid: Optional[int] = None,
+                 uploader: Optional[str] = None) -> Dict:
+    """生成展开结果中的一项"""
+    url = f"https://www.bilibili.com/video/{bvid}"
+    if page is not None:
+        url += f"?p={page}"
+    return {"url": url, "bvid": bvid, "title": title, "page": page or 1, "cid": cid, "uploader": uploader}
+
+def _owner_mid(item: Dict, key: str = "owner") -> Optional[str]:
+    """视频信息中UP主的ID"""
+    mid = (item.get(key) or {}).get("mid")
+    return str(mid) if mid else None
+
+def _expand_video(video_id: str, include_season: bool) -> List[Dict]:
+    """展开单个视频的所有分P，或其所属的整个合集"""
+    info = get_video_info(video_id)
+    season = info.get("ugc_season")
+    uploader = _owner_mid(info)
+    if include_season and season:
+        return [
+            _video_entry(episode["bvid"], episode.get("title", ""), cid=episode.get("cid"), uploader=uploader)
+            for section in season.get("sections") or []
+            for episode in section.get("episodes") or []
+        ]
+
+    bvid = info.get("bvid", video_id)
+    pages = info.get("pages") or []
+    if len(pages) <= 1:
+        return [_video_entry(bvid, info.get("title", ""), cid=info.get("cid"), uploader=uploader)]
+    return [
+        _video_entry(bvid, f"{info.get('title', '')} - {page.get('part', '')}", page=page["page"],
+                     cid=page.get("cid"), uploader=uploader)
+        for page in pages
+    ]
+
+def expand_url(url: str, include_season: bool = False) -> List[Dict]:
+    """
+    把多P视频、合集或收藏夹链接展开为单个视频的列表
+
+    支持的链接:
+    - 视频链接: 带p参数时只返回该分P，否则返回所有分P
+    - 合集: space.bilibili.com/<mid>/channel/collectiondetail?sid=<合集ID>
+      或 space.bilibili.com/<mid>/lists/<合集ID>
+    - 收藏夹: space.bilibili.com/<mid>/favlist?fid=<收藏夹ID>
+      或 www.bilibili.com/medialist/detail/ml<收藏夹ID>
+
+    Args:
+        url: 链接
+        include_season: 视频属于合集时是否展开整个合集
+
+    Returns:
+        List[Dict]: 每项包含url、bvid、title、page、cid和uploader(UP主ID)
+    """
+    url = url.strip()
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+
+    # 收藏夹
+    match = re.search(r'/medialist/detail/ml(\d+)', parsed.path)
+    media_id = match.group(1) if match else None
+    if media_id is None and parsed.path.rstrip('/').endswith('/favlist'):
+        media_id = query.get("fid", [None])[0]
+    if media_id:
+        medias = get_favorite_videos(media_id)
+        logger.info(f"收藏夹{media_id}包含{len(medias)}个视频")
+        return [_video_entry(media["bvid"], media.get("title", ""), uploader=_owner_mid(media, "upper"))
+                for media in medias]
+
+    # 合集
+    match = re.search(r'space\.bilibili\.com/(\d+)/(?:channel/collectiondetail|lists/(\d+))', url)
+    if match and query.get("type", ["season"])[0] == "season":
+        season_id = match.group(2) or query.get("sid", [None])[0]
+        if season_id:
+            archives = get_season_videos(match.group(1), season_id)
+            logger.info(f"合集{season_id}包含{len(archives)}个视频")
+            return [_video_entry(archive["bvid"], archive.get("title", ""), uploader=match.group(1))
+                    for archive in archives]
+
+    # 单个视频(可能有多个分P)
+    if "p" in query:
+        return [{"url": url, "bvid": extract_video_id(url), "title": "", "page": int(query["p"][0]),
+                 "cid": None, "uploader": None}]
+    video_id = extract_video_id(url)
+    if video_id is None:
+        raise ValueError(f"无法识别的链接: {url}")
+    return _expand_video(video_id, include_season)
@@ -1,28 +1,57 @@
 """
 缓存管理器，用于缓存API响应和视频信息
+
+缓存分为两层:
+- 磁盘层: 每个键一个JSON文件，程序重启后仍然有效
+- 内存层: 最近使用的条目保存在进程内，按条目数和近似字节数(JSON长度)限制大小，超出时淘汰
+  最久未使用的条目。命中内存层时不访问文件系统，写入时同时写入两层
 """
 import os
 import json
 import time
 import hashlib
+import threading
+from collections import OrderedDict
 from typing import Any, Optional
 
+from config import get_config_value
+
+# 内存层默认最多保留的条目数
+DEFAULT_MEMORY_ENTRIES = 256
+
+# 内存层默认的总大小上限（字节）
+DEFAULT_MEMORY_SIZE = 16 * 1024 * 1024
+
 class CacheManager:
     """缓存管理器"""
     
-    def __init__(self, cache_dir: str = None, max_age_seconds: int = 3600):
+    def __init__(self, cache_dir: str = None, max_age_seconds: int = 3600,
+                 memory_entries: Optional[int] = None, memory_size: Optional[int] = None):
         """
         初始化缓存管理器
         
         Args:
             cache_dir: 缓存目录，默认为程序目录下的cache文件夹
             max_age_seconds: 缓存最大有效期（秒），默认1小时
+            memory_entries: 内存层最多保留的条目数，默认读取配置cache_memory_entries，0表示不使用内存层
+            memory_size: 内存层的总大小上限（字节），默认读取配置cache_memory_size
         """
         if cache_dir is None:
             cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
         
         self.cache_dir = cache_dir
         self.max_age = max_age_seconds
+        if memory_entries is None:
+            memory_entries = get_config_value("cache_memory_entries", DEFAULT_MEMORY_ENTRIES)
+        if memory_size is None:
+            memory_size = get_config_value("cache_memory_size", DEFAULT_MEMORY_SIZE)
+        self.memory_entries = int(memory_entries)
+        self.memory_size = int(memory_size)
+        
+        # 内存层: 键 -> (到期时间, 近似字节数, 数据)，按最近使用时间从旧到新排列
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._memory_total = 0
+        self._memory_lock = threading.Lock()
         
         # 确保缓存目录存在
         if not os.path.exists(self.cache_dir):
@@ -56,9 +85,44 @@ class CacheManager:
         cache_key = self._get_cache_key(key)
         return os.path.join(self.cache_dir, f"{cache_key}.json")
     
+    def _expires_at(self, cache_data: dict) -> float:
+        """缓存条目的到期时间"""
+        expires = cache_data.get('expires')
+        if expires is not None:
+            return expires
+        return cache_data['timestamp'] + self.max_age
+    
+    def _remember(self, key: str, expires_at: float, text: str, data: Any):
+        """
+        把条目放入内存层，超出条目数或大小上限时淘汰最久未使用的条目
+        
+        Args:
+            key: 缓存键
+            expires_at: 到期时间
+            text: 数据的JSON文本，长度作为条目的近似大小
+            data: 数据
+        """
+        size = len(text)
+        with self._memory_lock:
+            self._forget(key)
+            if self.memory_entries <= 0 or size > self.memory_size:
+                return
+            self._memory[key] = (expires_at, size, data)
+            self._memory_total += size
+            while len(self._memory) > self.memory_entries or self._memory_total > self.memory_size:
+                self._forget(next(iter(self._memory)))
+    
+    def _forget(self, key: str):
+        """从内存层移除条目，调用时需持有锁"""
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_total -= entry[1]
+    
     def get(self, key: str) -> Optional[Any]:
         """
-        获取缓存内容
+        获取缓存内容，先查找内存层，未命中时读取缓存文件并放入内存层
+        
+        内存层命中时返回的是共享的对象，调用方不应修改
         
         Args:
             key: 缓存键
@@ -66,6 +130,15 @@ class CacheManager:
         Returns:
             Optional[Any]: 缓存内容，如果不存在或已过期则返回None
         """
+        key = str(key)
+        with self._memory_lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if time.time() <= entry[0]:
+                    self._memory.move_to_end(key)
+                    return entry[2]
+                self._forget(key)
+        
         cache_path = self._get_cache_path(key)
         
         # 检查缓存是否存在
@@ -75,28 +148,44 @@ class CacheManager:
         try:
             # 读取缓存
             with open(cache_path, 'r', encoding='utf-8') as f:
-                cache_data = json.load(f)
+                text = f.read()
+            cache_data = json.loads(text)
             
             # 检查是否过期
-            if time.time() - cache_data['timestamp'] > self.max_age:
+            if self._is_expired(cache_data):
                 return None
             
+            self._remember(key, self._expires_at(cache_data), text, cache_data['data'])
             return cache_data['data']
         except Exception:
             # 任何错误都认为缓存无效
             return None
     
-    def set(self, key: str, data: Any) -> bool:
+    def _is_expired(self, cache_data: dict) -> bool:
+        """
+        检查缓存是否过期，设置了单独有效期的条目按其到期时间判断
+        
+        Args:
+            cache_data: 缓存文件内容
+            
+        Returns:
+            bool: 是否已过期
+        """
+        return time.time() > self._expires_at(cache_data)
+    
+    def set(self, key: str, data: Any, ttl: Optional[float] = None) -> bool:
         """
-        设置缓存内容
+        设置缓存内容，同时写入内存层和缓存文件
         
         Args:
             key: 缓存键
             data: 要缓存的数据
+            ttl: 该条目的有效期（秒），默认使用max_age；例如带签名的视频流地址按其到期时间设置
             
         Returns:
             bool: 是否成功设置缓存
         """
+        key = str(key)
         cache_path = self._get_cache_path(key)
         
         try:
@@ -105,13 +194,21 @@ class CacheManager:
                 'timestamp': time.time(),
                 'data': data
             }
+            if ttl is not None:
+                cache_data['expires'] = cache_data['timestamp'] + ttl
+            
+            text = json.dumps(cache_data)
+            # 内存层保存数据的副本，调用方之后修改data不影响缓存内容
+            self._remember(key, self._expires_at(cache_data), text, json.loads(text)['data'])
             
             # 写入缓存
             with open(cache_path, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f)
+                f.write(text)
             
             return True
         except Exception:
+            with self._memory_lock:
+                self._forget(key)
             return False
     
     def clear(self, key: str = None) -> bool:
@@ -124,6 +221,13 @@ class CacheManager:
         Returns:
             bool: 是否成功清除缓存
         """
+        with self._memory_lock:
+            if key:
+                self._forget(str(key))
+            else:
+                self._memory.clear()
+                self._memory_total = 0
+        
         if key:
             # 清除指定键的缓存
             cache_path = self._get_cache_path(key)
@@ -152,6 +256,11 @@ class CacheManager:
         Returns:
             int: 清理的缓存数量
         """
+        now = time.time()
+        with self._memory_lock:
+            for key in [key for key, entry in self._memory.items() if now > entry[0]]:
+                self._forget(key)
+        
         count = 0
         try:
             for filename in os.listdir(self.cache_dir):
@@ -162,7 +271,7 @@ class CacheManager:
                             cache_data = json.load(f)
                         
                         # 检查是否过期
-                        if time.time() - cache_data['timestamp'] > self.max_age:
+                        if self._is_expired(cache_data):
                             os.remove(file_path)
                             count += 1
                     except Exception:
@@ -0,0 +1,51 @@
+"""
+协作式取消
+
+每个运行中的任务持有一个取消令牌，取消任务时只设置令牌，不需要持有下载管理器的锁:
+- 下载器在分块之间检查令牌，或者在进度回调中由下载管理器检查并抛出TaskCanceledError
+- 带宽限速的等待也会在令牌被设置后立即返回
+"""
+import threading
+from typing import Optional
+
+class TaskCanceledError(Exception):
+    """任务已被取消"""
+    pass
+
+class CancellationToken:
+    """取消令牌"""
+
+    __slots__ = ("_event",)
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        """取消，可以重复调用"""
+        self._event.set()
+
+    @property
+    def canceled(self) -> bool:
+        """是否已取消"""
+        return self._event.is_set()
+
+    def is_set(self) -> bool:
+        """与threading.Event兼容，可直接作为下载器的cancellation_event"""
+        return self._event.is_set()
+
+    def raise_if_canceled(self):
+        """已取消时抛出TaskCanceledError"""
+        if self._event.is_set():
+            raise TaskCanceledError("任务已取消")
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待取消
+
+        Args:
+            timeout: 超时时间（秒），None表示一直等待
+
+        Returns:
+            bool: 是否已取消
+        """
+        return self._event.wait(timeout)
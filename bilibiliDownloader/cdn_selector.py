@@ -0,0 +1,223 @@
+"""
+CDN节点选择
+
+B站playurl接口为每个流返回一个base_url和若干backup_url，分别指向不同的CDN节点:
+- 每个节点的延迟和吞吐量按指数加权移动平均记录，保存在cache_manager中，后续任务直接从最好的节点开始
+- 没有足够新的评分时，对所有候选节点并发发出小的范围请求，最先完成的节点胜出
+- 下载过程中节点失败或吞吐量过低时，由下载器切换到下一个候选节点
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from cache_manager import cache_manager
+from http_session import get_session
+from logger import logger
+
+# 评分在cache_manager中的键
+SCORES_CACHE_KEY = "cdn_host_scores"
+
+# 探测请求的字节数
+PROBE_BYTES = 256 * 1024
+
+# 评分有效期（秒），超过后重新探测
+SCORE_TTL = 600
+
+# 移动平均的权重
+EWMA_ALPHA = 0.3
+
+def host_of(url: str) -> str:
+    """URL的主机名"""
+    return (urlparse(url).hostname or "").lower()
+
+class HostScores:
+    """各CDN节点的延迟和吞吐量评分"""
+
+    def __init__(self, cache_key: str = SCORES_CACHE_KEY, save_interval: float = 5.0):
+        """
+        初始化评分表，从cache_manager加载已有评分
+
+        Args:
+            cache_key: 缓存键
+            save_interval: 两次保存的最小间隔（秒）
+        """
+        self.cache_key = cache_key
+        self.save_interval = save_interval
+        self.lock = threading.Lock()
+        # cache_manager返回的对象可能与其内存缓存共享，复制后再修改
+        cached = cache_manager.get(cache_key) or {}
+        self._scores: Dict[str, Dict] = {host: dict(score) for host, score in cached.items()}
+        self._last_save = 0.0
+        self._dirty = False
+
+    def record(self, host: str, latency: Optional[float] = None, speed: Optional[float] = None):
+        """
+        记录一次成功的请求
+
+        Args:
+            host: 主机名
+            latency: 首字节延迟（秒）
+            speed: 吞吐量（字节/秒）
+        """
+        with self.lock:
+            score = self._scores.setdefault(host, {"latency": None, "speed": None, "failures": 0})
+            if latency is not None:
+                score["latency"] = self._ewma(score.get("latency"), latency)
+            if speed is not None:
+                score["speed"] = self._ewma(score.get("speed"), speed)
+            score["failures"] = 0
+            score["updated"] = time.time()
+            self._dirty = True
+        self.save()
+
+    def record_failure(self, host: str):
+        """记录一次失败或吞吐量过低，连续失败的节点排在最后"""
+        with self.lock:
+            score = self._scores.setdefault(host, {"latency": None, "speed": None, "failures": 0})
+            score["failures"] = score.get("failures", 0) + 1
+            score["updated"] = time.time()
+            self._dirty = True
+        self.save()
+
+    @staticmethod
+    def _ewma(old: Optional[float], value: float) -> float:
+        return value if old is None else old + EWMA_ALPHA * (value - old)
+
+    def get(self, host: str) -> Optional[Dict]:
+        """获取主机的评分"""
+        with self.lock:
+            score = self._scores.get(host)
+            return dict(score) if score else None
+
+    def is_fresh(self, host: str) -> bool:
+        """主机是否有未过期且可用的评分"""
+        score = self.get(host)
+        return bool(score and score.get("speed") and not score.get("failures")
+                    and time.time() - score.get("updated", 0) < SCORE_TTL)
+
+    def rank(self, urls: List[str]) -> List[str]:
+        """
+        按评分排序候选地址: 连续失败少的优先，其次吞吐量高的优先，没有评分的保持原顺序排在已知节点之后
+
+        Args:
+            urls: 候选地址
+
+        Returns:
+            List[str]: 排序后的地址
+        """
+        def key(item):
+            index, url = item
+            score = self.get(host_of(url)) or {}
+            return (score.get("failures", 0), -(score.get("speed") or 0), index)
+        return [url for _, url in sorted(enumerate(urls), key=key)]
+
+    def save(self, force: bool = False):
+        """把评分写入cache_manager，按save_interval限制写入频率"""
+        with self.lock:
+            now = time.monotonic()
+            if not self._dirty or (not force and now - self._last_save < self.save_interval):
+                return
+            snapshot = dict(self._scores)
+            self._dirty = False
+            self._last_save = now
+        cache_manager.set(self.cache_key, snapshot)
+
+class CdnSelector:
+    """CDN节点选择器"""
+
+    def __init__(self, scores: Optional[HostScores] = None, probe_bytes: int = PROBE_BYTES, timeout: float = 5.0):
+        """
+        初始化选择器
+
+        Args:
+            scores: 评分表，默认使用全局评分表
+            probe_bytes: 探测请求的字节数
+            timeout: 探测超时时间（秒）
+        """
+        self.scores = scores or host_scores
+        self.probe_bytes = probe_bytes
+        self.timeout = timeout
+
+    def select(self, urls: List[str], session=None, headers: Optional[Dict] = None) -> List[str]:
+        """
+        对候选地址排序，第一个为应该使用的节点
+
+        最好的已知节点评分仍然有效时直接使用，否则并发探测所有候选节点
+
+        Args:
+            urls: 候选地址(base_url和backup_url)
+            session: HTTP会话，默认使用全局共享会话
+            headers: 额外的请求头
+
+        Returns:
+            List[str]: 排序后的候选地址
+        """
+        urls = list(dict.fromkeys(url for url in urls if url))
+        if len(urls) <= 1:
+            return urls
+        ranked = self.scores.rank(urls)
+        if self.scores.is_fresh(host_of(ranked[0])):
+            return ranked
+        winner = self.race(urls, session=session, headers=headers)
+        if winner is None:
+            return ranked
+        return [winner] + [url for url in ranked if url != winner]
+
+    def race(self, urls: List[str], session=None, headers: Optional[Dict] = None) -> Optional[str]:
+        """
+        并发探测候选节点，返回最先完成探测的地址
+
+        其余探测在后台继续完成，结果同样计入评分
+
+        Args:
+            urls: 候选地址
+            session: HTTP会话
+            headers: 额外的请求头
+
+        Returns:
+            Optional[str]: 胜出的地址，全部失败时返回None
+        """
+        session = session or get_session()
+        executor = ThreadPoolExecutor(max_workers=len(urls))
+        futures = {executor.submit(self._probe, session, url, headers or {}): url for url in urls}
+        winner = None
+        try:
+            for future in as_completed(futures, timeout=self.timeout * 2):
+                if future.result():
+                    winner = futures[future]
+                    break
+        except Exception:
+            # 全部超时
+            pass
+        finally:
+            executor.shutdown(wait=False)
+        if winner:
+            logger.debug(f"CDN探测胜出: {host_of(winner)}")
+        return winner
+
+    def _probe(self, session, url: str, headers: Dict) -> bool:
+        """请求开头的probe_bytes字节，记录延迟和吞吐量"""
+        host = host_of(url)
+        start = time.monotonic()
+        try:
+            request_headers = dict(headers, Range=f"bytes=0-{self.probe_bytes - 1}")
+            with session.get(url, headers=request_headers, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                latency = time.monotonic() - start
+                received = 0
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    received += len(chunk)
+                    if received >= self.probe_bytes:
+                        break
+            elapsed = time.monotonic() - start - latency
+            self.scores.record(host, latency=latency, speed=received / elapsed if elapsed > 0 else None)
+            return True
+        except Exception as e:
+            logger.debug(f"CDN探测失败: {host} - {str(e)}")
+            self.scores.record_failure(host)
+            return False
+
+# 全局评分表，所有任务共享
+host_scores = HostScores()
@@ -0,0 +1,167 @@
+"""
+按主机划分的熔断器，某个主机连续返回403/412时暂停请求，避免整批任务持续冲击被限流的CDN或接口
+
+状态:
+- closed: 正常请求，记录连续失败次数
+- open: 连续失败达到阈值后熔断，冷却期内拒绝请求
+- half_open: 冷却期结束后只放行一个探测请求，成功则恢复，失败则重新熔断并加倍冷却时间；
+  探测任务没有结果就结束(被取消或管理器关闭)时释放探测资格，放行下一个请求
+"""
+import re
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+_HOST_PATTERN = re.compile(r'https?://([^/\s:?#]+)')
+
+def extract_host(error_message: str, fallback_url: str = "") -> str:
+    """
+    从错误信息中提取出错的主机名，找不到时使用备用URL的主机名
+
+    Args:
+        error_message: 错误信息，requests的HTTPError中包含请求URL
+        fallback_url: 备用URL
+
+    Returns:
+        str: 主机名
+    """
+    match = _HOST_PATTERN.search(error_message or "")
+    if match:
+        return match.group(1).lower()
+    return (urlparse(fallback_url).hostname or "").lower()
+
+class _HostState:
+    """单个主机的熔断状态"""
+
+    __slots__ = ("failures", "state", "opened_until", "cooldown", "probe")
+
+    def __init__(self, cooldown: float):
+        self.failures = 0
+        self.state = "closed"
+        self.opened_until = 0.0
+        self.cooldown = cooldown
+        self.probe = None  # 半开状态下已放行的探测任务ID
+
+class CircuitBreaker:
+    """熔断器"""
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30.0, max_cooldown: float = 600.0,
+                 probe_interval: float = 1.0):
+        """
+        初始化熔断器
+
+        Args:
+            failure_threshold: 连续失败多少次后熔断
+            cooldown: 首次熔断的冷却时间（秒）
+            max_cooldown: 冷却时间上限（秒）
+            probe_interval: 等待探测结果时的重新检查间隔（秒）
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probe_interval = probe_interval
+        self.lock = threading.Lock()
+        self._hosts: Dict[str, _HostState] = {}
+
+    def record_failure(self, host: str) -> bool:
+        """
+        记录一次限流失败
+
+        Args:
+            host: 主机名
+
+        Returns:
+            bool: 是否因此熔断
+        """
+        with self.lock:
+            state = self._hosts.setdefault(host, _HostState(self.cooldown))
+            state.failures += 1
+            if state.state == "half_open":
+                # 探测失败，重新熔断并加倍冷却时间
+                state.cooldown = min(state.cooldown * 2, self.max_cooldown)
+            elif state.failures < self.failure_threshold:
+                return False
+            state.state = "open"
+            state.probe = None
+            state.opened_until = time.monotonic() + state.cooldown
+            return True
+
+    def record_success(self, host: Optional[str] = None):
+        """
+        记录一次成功，恢复对应主机
+
+        Args:
+            host: 主机名，None表示恢复所有处于探测中的主机
+        """
+        with self.lock:
+            if host is not None:
+                targets = [self._hosts[host]] if host in self._hosts else []
+            else:
+                targets = [state for state in self._hosts.values() if state.state != "open"]
+            for state in targets:
+                state.failures = 0
+                state.state = "closed"
+                state.probe = None
+                state.cooldown = self.cooldown
+
+    def retry_after(self) -> float:
+        """
+        计算还需要等待多久才能发出新的请求
+
+        冷却期结束的主机进入半开状态，放行的请求应通过assign_probe登记为探测请求，
+        探测结果出来之前其他请求继续等待
+
+        Returns:
+            float: 等待时间（秒），0表示可以立即请求
+        """
+        now = time.monotonic()
+        wait = 0.0
+        with self.lock:
+            for state in self._hosts.values():
+                if state.state == "open":
+                    if now < state.opened_until:
+                        wait = max(wait, state.opened_until - now)
+                        continue
+                    state.state = "half_open"
+                    continue
+                if state.state == "half_open" and state.probe is not None:
+                    # 已放行的探测请求尚未返回
+                    wait = max(wait, self.probe_interval)
+        return wait
+
+    def assign_probe(self, task_id: str) -> bool:
+        """
+        把放行的任务登记为半开主机的探测请求
+
+        Args:
+            task_id: 任务ID
+
+        Returns:
+            bool: 是否登记为探测请求
+        """
+        with self.lock:
+            assigned = False
+            for state in self._hosts.values():
+                if state.state == "half_open" and state.probe is None:
+                    state.probe = task_id
+                    assigned = True
+            return assigned
+
+    def release_probe(self, task_id: str):
+        """
+        任务没有结果就结束时调用，释放其探测资格，主机保持半开状态并放行下一个请求
+
+        Args:
+            task_id: 任务ID
+        """
+        with self.lock:
+            for state in self._hosts.values():
+                if state.probe == task_id:
+                    state.probe = None
+
+    def is_open(self, host: str) -> bool:
+        """主机当前是否处于熔断状态"""
+        with self.lock:
+            state = self._hosts.get(host)
+            return state is not None and state.state == "open" and time.monotonic() < state.opened_until
@@ -0,0 +1,110 @@
+"""
+自适应并发控制器，根据下载吞吐量和限流错误动态调整下载管理器的并发数
+
+调整规则(加性增、乘性减):
+- 出现新的403/412限流错误: 并发数减半
+- 单任务速度明显下降且总吞吐量没有提升: 并发数减1
+- 所有槽位都在使用、仍有等待任务且总吞吐量持续提升: 并发数加1
+- 其他情况保持不变
+"""
+import threading
+from typing import Optional
+
+from logger import logger
+
+class AdaptiveConcurrencyController:
+    """自适应并发控制器"""
+
+    def __init__(self, manager, min_concurrent: int = 1, max_concurrent: int = 8,
+                 interval: float = 5.0, gain_threshold: float = 0.05, drop_threshold: float = 0.3):
+        """
+        初始化控制器
+
+        Args:
+            manager: 下载管理器，需要提供get_load_sample和set_max_concurrent
+            min_concurrent: 并发数下限
+            max_concurrent: 并发数上限
+            interval: 采样间隔（秒）
+            gain_threshold: 总吞吐量提升超过该比例才继续增加并发
+            drop_threshold: 单任务速度下降超过该比例时减少并发
+        """
+        self.manager = manager
+        self.min_concurrent = max(1, min_concurrent)
+        self.max_concurrent = max(self.min_concurrent, max_concurrent)
+        self.interval = interval
+        self.gain_threshold = gain_threshold
+        self.drop_threshold = drop_threshold
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_sample = None
+        self._last_throughput = 0.0
+        self._last_per_task = 0.0
+
+    def start(self):
+        """启动控制线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._last_sample = self.manager.get_load_sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        logger.debug(f"自适应并发控制已启动: {self.min_concurrent}-{self.max_concurrent}")
+
+    def stop(self):
+        """停止控制线程"""
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+        self._thread = None
+
+    def _run(self):
+        """控制循环"""
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.adjust()
+            except Exception as e:
+                logger.error(f"自适应并发调整异常: {str(e)}")
+
+    def adjust(self) -> int:
+        """
+        采样一次并调整并发数
+
+        Returns:
+            int: 调整后的并发数
+        """
+        sample = self.manager.get_load_sample()
+        last = self._last_sample
+        self._last_sample = sample
+
+        elapsed = sample["time"] - last["time"]
+        current = sample["max_concurrent"]
+        if elapsed <= 0:
+            return current
+
+        throughput = (sample["bytes"] - last["bytes"]) / elapsed
+        new_errors = sample["throttle_errors"] - last["throttle_errors"]
+        active = sample["active"]
+        per_task = throughput / active if active else 0.0
+
+        target = current
+        reason = "超出并发范围"
+        if new_errors > 0:
+            target = max(self.min_concurrent, current // 2)
+            reason = f"出现{new_errors}次限流错误"
+        elif (self._last_per_task > 0 and per_task < self._last_per_task * (1 - self.drop_threshold)
+              and throughput <= self._last_throughput * (1 + self.gain_threshold)):
+            target = max(self.min_concurrent, current - 1)
+            reason = "单任务速度下降"
+        elif (active >= current and sample["pending"] > 0
+              and throughput > self._last_throughput * (1 + self.gain_threshold)):
+            target = min(self.max_concurrent, current + 1)
+            reason = "总吞吐量提升"
+
+        self._last_throughput = throughput
+        self._last_per_task = per_task
+
+        target = min(self.max_concurrent, max(self.min_concurrent, target))
+        if target != current:
+            logger.info(f"自适应并发调整: {current} -> {target} ({reason})")
+            self.manager.set_max_concurrent(target)
+        return target
@@ -117,6 +117,21 @@ def update_config(key, value):
     
     print(f"Debug - 配置项'{key}'已更新")
 
+def get_config_value(key, default=None):
+    """
+    读取配置项，用户设置优先于默认配置
+    
+    Args:
+        key: 配置键
+        default: 两者都没有时的默认值
+        
+    Returns:
+        配置值
+    """
+    if key in USER_CONFIG:
+        return USER_CONFIG[key]
+    return DEFAULT_CONFIG.get(key, default)
+
 # 用户配置
 USER_CONFIG = load_user_config()
 
@@ -126,6 +141,16 @@ DEFAULT_CONFIG = {
     "thread_count": 8,          # 默认下载线程数
     "default_quality": "superhigh",  # 默认画质选择为4K
     "chunk_size": 1024 * 1024,  # 每个分块1MB
+    "max_bandwidth": 0,         # 全局带宽上限（字节/秒），0表示不限速
+    "max_connections_per_host": 16,  # 每个主机的最大HTTP连接数
+    "max_finished_tasks": 1000,  # 内存中保留的已结束任务数，更早的任务移入归档
+    "content_store_enabled": True,  # 是否把下载完成的流登记到本地内容存储，之后下载同一个流时直接复用
+    "content_store_max_size": 20 * 1024 * 1024 * 1024,  # 已下载流存储的总大小上限（字节），超出时淘汰最久未使用的流
+    "segmented_min_size": 16 * 1024 * 1024,  # 小于该大小的流单连接下载，否则分段并行下载
+    "downloader_pool_size": 4,  # 池中保留的空闲下载器实例数
+    "prefetch_depth": 3,        # 为等待队列中接下来的几个任务预取视频信息和视频流地址，0表示不预取
+    "cache_memory_entries": 256,  # 内存中保留的最近使用的缓存条目数，0表示每次都读取缓存文件
+    "cache_memory_size": 16 * 1024 * 1024,  # 内存中缓存条目的总大小上限（字节）
     "debug": True,              # 调试模式
     # B站登录信息，从用户配置中加载
     "sessdata": USER_CONFIG.get("sessdata", ""),      # 登录cookie: SESSDATA
@@ -183,6 +208,8 @@ QUALITY_MAP = {
 BILIBILI_API = {
     "video_info": "https://api.bilibili.com/x/web-interface/view",  # 使用基础API
     "video_stream": "https://api.bilibili.com/x/player/playurl",    # 使用基础API
+    "season_archives": "https://api.bilibili.com/x/polymer/web-space/seasons_archives_list",  # 合集视频列表
+    "favorites": "https://api.bilibili.com/x/v3/fav/resource/list",  # 收藏夹内容
     "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
     "accept": "application/json, text/plain, */*",
     "accept_language": "zh-CN,zh;q=0.9,en;q=0.8",
@@ -192,6 +219,12 @@ BILIBILI_API = {
 # 历史记录文件
 HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "download_history.json")
 
+# 任务日志文件，用于重启后恢复未完成的下载任务
+TASK_JOURNAL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "task_journal.jsonl")
+
+# 任务归档文件，保存移出内存的已结束任务
+TASK_ARCHIVE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "task_archive.jsonl")
+
 # 错误重试次数
 MAX_RETRIES = 3
 RETRY_DELAY = 1  # 重试延迟（秒）
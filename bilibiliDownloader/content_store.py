@@ -0,0 +1,300 @@
+"""
+已下载流的本地内容存储
+
+同一个视频以相同画质下载到不同目录、或为不同账号下载时，流的内容完全相同；同一个音频流
+也会出现在每个画质的下载中。下载完成的流按 (cid, 流ID, 大小, ETag) 登记到存储目录，
+下载器请求流之前先查找存储，命中时直接链接或复制到目标路径，不再访问网络:
+- 优先使用硬链接，不支持时(跨文件系统)尝试reflink(写时复制)，最后退化为普通复制
+- 存储总大小有上限，超出时按最近使用时间淘汰
+- 索引保存在存储目录下的index.json
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from config import get_config_value
+from logger import logger
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
+# Linux的FICLONE ioctl，在btrfs、xfs等文件系统上创建共享数据块的副本
+FICLONE = 0x40049409
+
+INDEX_FILE = "index.json"
+
+# 默认存储总大小上限（字节）
+DEFAULT_MAX_SIZE = 20 * 1024 * 1024 * 1024
+
+def _reflink(source: str, target: str) -> bool:
+    """用reflink复制文件，不支持时返回False"""
+    if fcntl is None:
+        return False
+    try:
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        try:
+            os.remove(target)
+        except OSError:
+            pass
+        return False
+
+def place_file(source: str, target: str) -> str:
+    """
+    把文件放到目标路径，依次尝试硬链接、reflink和复制
+
+    Args:
+        source: 源文件
+        target: 目标路径，已存在时会被替换
+
+    Returns:
+        str: 使用的方式(hardlink、reflink或copy)
+    """
+    temp = target + ".tmp"
+    if os.path.exists(temp):
+        os.remove(temp)
+    try:
+        os.link(source, temp)
+        method = "hardlink"
+    except OSError:
+        if _reflink(source, temp):
+            method = "reflink"
+        else:
+            shutil.copyfile(source, temp)
+            method = "copy"
+    os.replace(temp, target)
+    return method
+
+class ContentStore:
+    """按内容标识索引的流文件存储"""
+
+    def __init__(self, store_dir: Optional[str] = None, max_size: Optional[int] = None):
+        """
+        初始化存储，加载已有索引
+
+        Args:
+            store_dir: 存储目录，默认为程序目录下的content_store文件夹
+            max_size: 存储总大小上限（字节），默认读取配置content_store_max_size
+        """
+        if store_dir is None:
+            store_dir = get_config_value("content_store_dir") or \
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "content_store")
+        if max_size is None:
+            max_size = get_config_value("content_store_max_size", DEFAULT_MAX_SIZE)
+
+        self.store_dir = store_dir
+        self.max_size = int(max_size)
+        self.lock = threading.Lock()
+        # 键 -> 条目，按最近使用时间从旧到新排列
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._total = 0
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def make_key(cid, stream_id, size: Optional[int] = None, etag: Optional[str] = None) -> str:
+        """
+        生成条目的键
+
+        Args:
+            cid: 视频分P的cid
+            stream_id: 流ID(画质ID，音频为音质ID)，同一画质有多种编码时应包含编码ID
+            size: 流的大小
+            etag: 服务器返回的ETag
+
+        Returns:
+            str: 键
+        """
+        etag = (etag or "").strip()
+        if etag.startswith("W/"):
+            etag = etag[2:]
+        return f"{cid}:{stream_id}:{size or ''}:{etag.strip(chr(34))}"
+
+    def _file_path(self, key: str) -> str:
+        return os.path.join(self.store_dir, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _load(self):
+        """加载索引，丢弃文件已不存在或大小不符的条目"""
+        try:
+            with open(os.path.join(self.store_dir, INDEX_FILE), 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"内容存储索引无法读取，将重新建立: {str(e)}")
+            return
+
+        for key, entry in sorted(entries.items(), key=lambda item: item[1].get("last_used", 0)):
+            try:
+                if os.path.getsize(self._file_path(key)) == entry["size"]:
+                    self._entries[key] = entry
+                    self._total += entry["size"]
+            except (OSError, KeyError, TypeError):
+                continue
+
+    def _save(self):
+        """写入索引，调用时需持有锁"""
+        path = os.path.join(self.store_dir, INDEX_FILE)
+        try:
+            with open(path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.warning(f"内容存储索引保存失败: {str(e)}")
+
+    def _find(self, cid, stream_id, size: Optional[int], etag: Optional[str]) -> Optional[str]:
+        """查找匹配的条目，size和etag为None时不比较，调用时需持有锁"""
+        if size is not None and etag is not None:
+            key = self.make_key(cid, stream_id, size, etag)
+            return key if key in self._entries else None
+        prefix = f"{cid}:{stream_id}:"
+        # 从最近使用的条目开始查找
+        for key in reversed(self._entries):
+            if not key.startswith(prefix):
+                continue
+            entry = self._entries[key]
+            if size is not None and entry["size"] != size:
+                continue
+            if etag is not None and key != self.make_key(cid, stream_id, entry["size"], etag):
+                continue
+            return key
+        return None
+
+    def lookup(self, cid, stream_id, size: Optional[int] = None, etag: Optional[str] = None) -> Optional[str]:
+        """
+        查找已存储的流
+
+        playurl返回的DASH流通常不带大小，此时只按cid和流ID匹配，不需要任何网络请求
+
+        Args:
+            cid: 视频分P的cid
+            stream_id: 流ID
+            size: 流的大小，None表示不比较
+            etag: ETag，None表示不比较
+
+        Returns:
+            Optional[str]: 存储中的文件路径，未命中时返回None
+        """
+        with self.lock:
+            key = self._find(cid, stream_id, size, etag)
+            return self._file_path(key) if key else None
+
+    def fetch(self, cid, stream_id, target: str, size: Optional[int] = None,
+              etag: Optional[str] = None) -> Optional[Dict]:
+        """
+        命中时把存储中的流放到目标路径
+
+        Args:
+            cid: 视频分P的cid
+            stream_id: 流ID
+            target: 目标路径
+            size: 流的大小，None表示不比较
+            etag: ETag，None表示不比较
+
+        Returns:
+            Optional[Dict]: 条目信息(size，以及登记时记录的digest)，未命中时返回None
+        """
+        with self.lock:
+            key = self._find(cid, stream_id, size, etag)
+            if key is None:
+                return None
+            source = self._file_path(key)
+            entry = self._entries[key]
+            try:
+                method = place_file(source, target)
+            except OSError as e:
+                # 存储中的文件已被删除或损坏
+                logger.warning(f"内容存储读取失败: {str(e)}")
+                self._discard(key)
+                self._save()
+                return None
+            entry["last_used"] = time.time()
+            self._entries.move_to_end(key)
+            self._save()
+            entry = dict(entry)
+        logger.info(f"复用已下载的流({method}): {os.path.basename(target)}")
+        return entry
+
+    def add(self, cid, stream_id, path: str, etag: Optional[str] = None, digest: Optional[Dict] = None) -> bool:
+        """
+        登记下载完成的流，超出大小上限时淘汰最久未使用的条目
+
+        Args:
+            cid: 视频分P的cid
+            stream_id: 流ID
+            path: 下载完成的文件
+            etag: ETag
+            digest: 下载时计算的摘要
+
+        Returns:
+            bool: 是否登记成功
+        """
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return False
+        if size > self.max_size:
+            return False
+
+        key = self.make_key(cid, stream_id, size, etag)
+        with self.lock:
+            if key in self._entries:
+                self._entries[key]["last_used"] = time.time()
+                self._entries.move_to_end(key)
+                self._save()
+                return True
+            try:
+                place_file(path, self._file_path(key))
+            except OSError as e:
+                logger.warning(f"内容存储写入失败: {str(e)}")
+                return False
+            self._entries[key] = {"size": size, "digest": digest, "last_used": time.time()}
+            self._total += size
+            while self._total > self.max_size and len(self._entries) > 1:
+                self._discard(next(iter(self._entries)))
+            self._save()
+        return True
+
+    def _discard(self, key: str):
+        """删除条目和文件，调用时需持有锁"""
+        entry = self._entries.pop(key)
+        self._total -= entry["size"]
+        try:
+            os.remove(self._file_path(key))
+        except OSError:
+            pass
+
+    @property
+    def total_size(self) -> int:
+        """存储中所有文件的总大小"""
+        with self.lock:
+            return self._total
+
+    def clear(self):
+        """删除所有条目"""
+        with self.lock:
+            for key in list(self._entries):
+                self._discard(key)
+            self._save()
+
+_content_store: Optional[ContentStore] = None
+_content_store_lock = threading.Lock()
+
+def get_content_store() -> ContentStore:
+    """获取全局内容存储，首次调用时创建"""
+    global _content_store
+    with _content_store_lock:
+        if _content_store is None:
+            _content_store = ContentStore()
+        return _content_store
@@ -4,6 +4,7 @@
 下载任务状态:
 - pending: 等待下载
 - downloading: 正在下载
+- processing: 后期处理中(合并音视频)
 - completed: 下载完成
 - failed: 下载失败
 - canceled: 下载取消
@@ -68,29 +69,156 @@
 - 下载器工厂使用工
 下载管理器，管理多个下载任务
 """
+import heapq
+import itertools
+import os
+import random
 import threading
-import queue
 import time
-from typing import Dict, List, Optional, Callable
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Callable, Tuple
+from urllib.parse import parse_qs, urlparse
 
-from downloader_factory import create_downloader
+from bilibili_api import expand_url, prefetch_video, video_info_cache_key
+from cache_manager import cache_manager
+from cancellation import CancellationToken
+from circuit_breaker import CircuitBreaker, extract_host
+from concurrency_controller import AdaptiveConcurrencyController
+from config import DEFAULT_CONFIG, MAX_RETRIES, RETRY_DELAY, TASK_ARCHIVE_FILE, TASK_JOURNAL_FILE
+from downloader_factory import create_downloader, release_downloader
+from error_handler import analyze_error, is_throttled
+from input_validator import extract_video_details
 from logger import logger
+from post_processor import process_streams
+from progress_coalescer import ProgressCoalescer
+from quality_manager import QualityManager
+from rate_limiter import BandwidthLimiter
+from scheduler import create_policy
+from task_archive import TaskArchive
+from task_journal import TaskJournal
+from task_metrics import MetricsAggregator, TaskMetrics
+from utils import extract_video_id
+
+# 预取元数据的线程数
+PREFETCH_WORKERS = 2
+
+def canonical_task_key(url: str, save_dir: str, quality: str) -> Tuple:
+    """
+    将任务规范化为去重键，同一视频的不同URL形式(含b23.tv短链接)得到相同的键
+    
+    Args:
+        url: 视频地址
+        save_dir: 保存目录
+        quality: 画质
+        
+    Returns:
+        Tuple: (视频ID, 分P, 画质, 保存目录)
+    """
+    url = url.strip()
+    details = extract_video_details(url)
+    if details is None:
+        # 短链接等无法直接识别的形式，解析跳转后再提取
+        video_id = extract_video_id(url)
+        details = extract_video_details(video_id) if video_id else None
+        
+    if details:
+        video_key = f"{details['id_type']}:{details['id']}"
+    else:
+        video_key = url
+        
+    # 分P不同视为不同任务
+    page = parse_qs(urlparse(url).query).get("p", ["1"])[0]
+    
+    return (video_key, page, quality, os.path.normcase(os.path.abspath(save_dir)))
 
 class DownloadTask:
     """下载任务"""
     
-    def __init__(self, url: str, save_dir: str, quality: str, task_id: str):
+    # 使用__slots__减少大批量任务时每个任务的内存占用
+    __slots__ = (
+        "url", "save_dir", "quality", "task_id", "priority", "size_hint", "uploader", "weight",
+        "group", "metadata_key", "playurl_key", "dedup_key", "token", "status", "progress", "result", "error", "downloader", "downloaded_bytes",
+        "retries", "start_time", "end_time", "metrics"
+    )
+    
+    def __init__(self, url: str, save_dir: str, quality: str, task_id: str,
+                 priority: int = 0, size_hint: Optional[int] = None, uploader: Optional[str] = None,
+                 weight: float = 1.0, group: Optional[str] = None):
         self.url = url
         self.save_dir = save_dir
         self.quality = quality
         self.task_id = task_id
-        self.status = "pending"  # pending, downloading, completed, failed, canceled
+        self.priority = priority  # 优先级，数值越大越先执行
+        self.size_hint = size_hint  # 已知的流大小(字节)，用于短任务优先
+        self.uploader = uploader  # UP主，用于按UP主轮转
+        self.weight = weight  # 带宽权重，限速时按权重分配带宽
+        self.group = group  # 任务组，用于整组取消
+        self.metadata_key = None  # 已解析的视频信息在cache_manager中的键，同组任务共用
+        self.playurl_key = None  # 预取的视频流地址在cache_manager中的键，不持久化(地址会过期)
+        self.dedup_key = None  # 去重键，见canonical_task_key
+        self.status = "pending"  # pending, downloading, processing, completed, failed, canceled
         self.progress = 0
         self.result = None
         self.error = None
         self.downloader = None
+        self.token = None  # 取消令牌，任务开始运行时创建
+        self.downloaded_bytes = 0  # 已下载字节数
+        self.retries = 0  # 已重试次数
         self.start_time = None
         self.end_time = None
+        self.metrics = TaskMetrics()  # 性能指标
+        
+    def to_dict(self) -> Dict:
+        """导出可持久化的任务信息"""
+        return {
+            "task_id": self.task_id,
+            "url": self.url,
+            "save_dir": self.save_dir,
+            "quality": self.quality,
+            "priority": self.priority,
+            "size_hint": self.size_hint,
+            "uploader": self.uploader,
+            "weight": self.weight,
+            "group": self.group,
+            "metadata_key": self.metadata_key,
+            "dedup_key": list(self.dedup_key) if self.dedup_key else None,
+            "retries": self.retries
+        }
+        
+    def to_record(self) -> Dict:
+        """导出包含状态和结果的完整任务信息，用于归档"""
+        record = self.to_dict()
+        record.update({
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "downloaded_bytes": self.downloaded_bytes,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "metrics": self.metrics.to_dict(self.retries)
+        })
+        return record
+        
+    @classmethod
+    def from_dict(cls, record: Dict) -> "DownloadTask":
+        """从to_dict或to_record导出的信息恢复任务"""
+        task = cls(
+            record["url"], record["save_dir"], record["quality"], record["task_id"],
+            priority=record.get("priority", 0),
+            size_hint=record.get("size_hint"),
+            uploader=record.get("uploader"),
+            weight=record.get("weight", 1.0),
+            group=record.get("group")
+        )
+        if record.get("dedup_key"):
+            task.dedup_key = tuple(record["dedup_key"])
+        for name in ("metadata_key", "retries", "status", "progress", "result", "error", "downloaded_bytes", "start_time", "end_time"):
+            if name in record:
+                setattr(task, name, record[name])
+        return task
         
     def __str__(self):
         return f"Task {self.task_id}: {self.url} - {self.status} ({self.progress}%)"
@@ -98,210 +226,1098 @@ class DownloadTask:
 class DownloadManager:
     """下载管理器"""
     
-    def __init__(self, max_concurrent: int = 2):
+    def __init__(self, max_concurrent: int = 2, policy: str = "fifo", journal_path: Optional[str] = None,
+                 max_bandwidth: int = 0, post_process_workers: int = 1, progress_interval: float = 0.1,
+                 max_finished_tasks: Optional[int] = None, archive_path: Optional[str] = None,
+                 max_retries: int = MAX_RETRIES, retry_delay: float = RETRY_DELAY, max_retry_delay: float = 60.0,
+                 prefetch_depth: int = 0):
         self.tasks = {}  # 所有任务
-        self.queue = queue.Queue()  # 等待队列
+        self.dedup_index = {}  # 去重键 -> 内存中的任务ID，已归档的任务由归档按去重键查找
+        self.groups = {}  # 任务组 -> 任务ID集合
+        self.queue = create_policy(policy)  # 等待队列，由调度策略决定出队顺序
         self.active_tasks = set()  # 活动任务ID
         self.max_concurrent = max_concurrent
         self.lock = threading.RLock()
+        # 与lock共用同一把锁，有空闲槽位或新任务时立即唤醒工作线程
+        self.condition = threading.Condition(self.lock)
         self.workers = []
         self.status_callback = None
+        self.status_listeners = []  # 额外的状态监听器
+        # 进度通知合并，避免每个分块都触发回调
+        self.progress_coalescer = ProgressCoalescer(progress_interval)
         self.is_running = False
         
+        # 负载统计，供自适应并发控制使用
+        self.bytes_downloaded = 0  # 所有任务累计下载字节数
+        self.throttle_errors = 0  # 累计403/412限流错误次数
+        self.concurrency_controller = None
+        # 已结束任务的性能指标汇总
+        self.stats = MetricsAggregator()
+        
+        # 后期处理阶段，使用独立的线程池合并音视频，不占用下载槽位
+        self.post_process_workers = max(1, post_process_workers)
+        self.post_executor = None
+        self.post_queued = 0  # 等待后期处理的任务数
+        self.post_active = 0  # 正在后期处理的任务数
+        
+        # 全局带宽限制，所有任务和分段共享
+        self.bandwidth_limiter = BandwidthLimiter(max_bandwidth)
+        
+        # 重试策略: 可恢复的错误按带抖动的指数退避重新排队
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.delayed = []  # 等待重试的任务堆: [到期时间, 序号, 任务ID]
+        self._delayed_counter = itertools.count()
+        # 某个主机连续403/412时熔断，暂停派发新任务
+        self.circuit_breaker = CircuitBreaker()
+        
+        # 预取: 后台为队列中接下来的prefetch_depth个任务解析视频信息和视频流地址，
+        # 任务开始时下载器直接从cache_manager读取，不必先串行请求多个接口
+        self.prefetch_depth = prefetch_depth
+        self.prefetch_executor = None
+        self.prefetched = set()  # 已预取或正在预取的任务ID
+        
+        # 保留策略: 内存中最多保留max_finished_tasks个已结束的任务，更早的任务移入归档
+        self.max_finished_tasks = max_finished_tasks
+        self.finished_tasks = deque()  # 按结束顺序排列的已结束任务ID
+        self.archiving = {}  # 已移出任务表、正在写入归档的任务，写入期间仍可查询和去重
+        self.archive = TaskArchive(archive_path) if archive_path else None
+        
+        # 任务日志，重启后恢复未完成的任务；在start()中恢复，创建管理器时不会开始下载
+        self.journal = TaskJournal(journal_path) if journal_path else None
+        self._restored = False
+        
+    def start(self):
+        """
+        恢复任务日志中未完成的任务并启动工作线程
+        
+        应在设置状态回调和监听器之后调用；没有调用时，第一次添加任务时自动调用
+        """
+        # 持有锁完成恢复，同时添加的任务在恢复之后才写入任务日志
+        with self.lock:
+            if self.journal is not None and not self._restored:
+                self._restored = True
+                self._restore_tasks()
+        self._ensure_workers()
+        
+    def _restore_tasks(self):
+        """重放任务日志，将等待中和被中断的任务重新加入队列"""
+        records = self.journal.replay()
+        if not records:
+            return
+            
+        with self.condition:
+            for record in records:
+                if record["task_id"] in self.tasks:
+                    continue
+                task = DownloadTask.from_dict(dict(record, status="pending"))
+                if task.dedup_key:
+                    self.dedup_index[task.dedup_key] = task.task_id
+                if task.group is not None:
+                    self.groups.setdefault(task.group, set()).add(task.task_id)
+                self.tasks[task.task_id] = task
+                self.queue.push(task)
+            self.condition.notify_all()
+            
+        logger.info(f"从任务日志恢复{len(records)}个未完成任务")
+        
+    def _record_status(self, task_id: str, status: str):
+        """记录任务状态变化到任务日志"""
+        if self.journal:
+            self.journal.record_status(task_id, status)
+        
     def set_status_callback(self, callback: Callable):
         """设置状态更新回调"""
         self.status_callback = callback
         
-    def add_task(self, url: str, save_dir: str, quality: str) -> str:
-        """添加下载任务"""
+    def set_batch_progress_callback(self, callback: Optional[Callable], interval: float = 0.1):
+        """
+        设置批量进度回调，按固定间隔一次性通知所有活动任务的最新进度
+        
+        Args:
+            callback: 批量回调，参数为 {task_id: 进度百分比}，None表示取消
+            interval: 通知间隔（秒）
+        """
+        self.progress_coalescer.set_batch_callback(callback, interval)
+        
+    def add_status_listener(self, listener: Callable):
+        """添加额外的状态监听器，参数与状态更新回调相同"""
+        with self.lock:
+            # 写时复制，通知时无需加锁遍历
+            if listener not in self.status_listeners:
+                self.status_listeners = self.status_listeners + [listener]
+        
+    def remove_status_listener(self, listener: Callable):
+        """移除状态监听器"""
+        with self.lock:
+            if listener in self.status_listeners:
+                self.status_listeners = [l for l in self.status_listeners if l != listener]
+        
+    def _notify(self, task_id: str, status: str, progress: int, *args):
+        """通知状态更新回调和所有监听器"""
+        if status in ("completed", "failed", "canceled"):
+            self.progress_coalescer.forget(task_id)
+        if self.status_callback:
+            self.status_callback(task_id, status, progress, *args)
+        for listener in self.status_listeners:
+            try:
+                listener(task_id, status, progress, *args)
+            except Exception as e:
+                logger.error(f"状态监听器异常: {str(e)}")
+        
+    def set_policy(self, policy: str):
+        """
+        切换调度策略，等待中的任务按原有顺序迁移到新策略
+        
+        Args:
+            policy: 策略名称 (fifo, priority, sjf, round_robin)
+        """
+        new_queue = create_policy(policy)
+        
+        with self.condition:
+            while True:
+                task_id = self.queue.pop()
+                if task_id is None:
+                    break
+                if task_id in self.tasks:
+                    new_queue.push(self.tasks[task_id])
+            self.queue = new_queue
+            
+        logger.info(f"调度策略已切换为: {policy}")
+        
+    def add_task(self, url: str, save_dir: str, quality: str, priority: int = 0,
+                 size_hint: Optional[int] = None, uploader: Optional[str] = None,
+                 weight: float = 1.0, dedupe: bool = True, group: Optional[str] = None) -> str:
+        """
+        添加下载任务，参数见submit_task
+        
+        Returns:
+            str: 任务ID，重复提交时为已有任务的ID
+        """
+        task_id, _ = self.submit_task(url, save_dir, quality, priority=priority, size_hint=size_hint,
+                                      uploader=uploader, weight=weight, dedupe=dedupe, group=group)
+        return task_id
+        
+    def submit_task(self, url: str, save_dir: str, quality: str, priority: int = 0,
+                    size_hint: Optional[int] = None, uploader: Optional[str] = None,
+                    weight: float = 1.0, dedupe: bool = True, group: Optional[str] = None,
+                    metadata_key: Optional[str] = None) -> Tuple[str, bool]:
+        """
+        添加下载任务，并返回是否被去重
+        
+        同一视频、分P、画质和保存目录的任务正在等待、下载、处理或已完成时，不再重复下载，
+        直接返回已有任务
+        
+        Args:
+            url: 视频地址
+            save_dir: 保存目录
+            quality: 画质
+            priority: 优先级，数值越大越先执行(priority/sjf策略生效)
+            size_hint: 已知的流大小(字节)，sjf策略按此排序
+            uploader: UP主标识，round_robin策略按此轮转
+            weight: 带宽权重，限速时按权重分配带宽
+            dedupe: 是否合并重复任务
+            group: 任务组，可用cancel_group整组取消；合并到的已有任务不加入该组
+            metadata_key: 已解析的视频信息在cache_manager中的键
+            
+        Returns:
+            Tuple[str, bool]: (任务ID, 是否为已有任务)
+        """
+        dedup_key = canonical_task_key(url, save_dir, quality) if dedupe else None
+        
         # 生成任务ID
-        import uuid
         task_id = str(uuid.uuid4())[:8]
         
         # 创建任务
-        task = DownloadTask(url, save_dir, quality, task_id)
+        task = DownloadTask(url, save_dir, quality, task_id, priority=priority,
+                            size_hint=size_hint, uploader=uploader, weight=weight, group=group)
+        task.dedup_key = dedup_key
+        task.metadata_key = metadata_key
         
-        with self.lock:
+        # 首次添加任务前恢复任务日志并启动工作线程
+        self.start()
+        
+        # 合并已归档的重复任务，读取归档文件时不持有锁
+        if dedup_key is not None:
+            with self.lock:
+                existing = self._find_duplicate(dedup_key)
+            archived_id = self._find_archived(dedup_key) if existing is None else None
+            if archived_id is not None:
+                logger.info(f"重复的下载任务，已合并到已归档的任务: {archived_id} - {url}")
+                return archived_id, True
+                
+        with self.condition:
+            # 合并内存中的重复任务
+            if dedup_key is not None:
+                existing = self._find_duplicate(dedup_key)
+                if existing is not None:
+                    logger.info(f"重复的下载任务，已合并到任务: {existing.task_id} - {url}")
+                    return existing.task_id, True
+                self.dedup_index[dedup_key] = task_id
+                
             # 添加到任务字典
             self.tasks[task_id] = task
-            # 添加到队列
-            self.queue.put(task_id)
+            if group is not None:
+                self.groups.setdefault(group, set()).add(task_id)
+            # 先记录任务信息，工作线程的状态变化不会先于任务本身写入任务日志
+            if self.journal:
+                self.journal.record_task(task.to_dict())
+            # 添加到队列，并唤醒一个空闲的工作线程
+            self.queue.push(task)
+            self.condition.notify()
+            self._schedule_prefetch()
             
         logger.info(f"添加下载任务: {task_id} - {url}")
         
-        # 确保工作线程在运行
-        self._ensure_workers()
+        return task_id, False
+    
+    def add_batch(self, url: str, save_dir: str, quality: str, priority: int = 0,
+                  include_season: bool = False, group: Optional[str] = None,
+                  weight: float = 1.0, dedupe: bool = True) -> Tuple[str, List[str]]:
+        """
+        把多P视频、合集或收藏夹展开为一组下载任务
         
-        return task_id
+        元数据通过分页接口一次性获取并缓存，同一视频的各个分P共用已解析的视频信息
+        
+        Args:
+            url: 多P视频、合集或收藏夹链接，支持的形式见bilibili_api.expand_url
+            save_dir: 保存目录
+            quality: 画质
+            priority: 优先级
+            include_season: 视频属于合集时是否展开整个合集
+            group: 任务组，默认生成新的组ID
+            weight: 带宽权重
+            dedupe: 是否合并重复任务
+            
+        Returns:
+            Tuple[str, List[str]]: (任务组ID, 按展开顺序排列的任务ID)
+        """
+        entries = expand_url(url, include_season=include_season)
+        group = group or str(uuid.uuid4())[:8]
+        
+        task_ids = []
+        for entry in entries:
+            metadata_key = video_info_cache_key(entry["bvid"]) if entry.get("bvid") else None
+            task_id, _ = self.submit_task(entry["url"], save_dir, quality, priority=priority,
+                                          uploader=entry.get("uploader"), weight=weight, dedupe=dedupe,
+                                          group=group, metadata_key=metadata_key)
+            task_ids.append(task_id)
+            
+        logger.info(f"添加任务组: {group} - {url}，共{len(task_ids)}个任务")
+        return group, task_ids
+    
+    def _find_duplicate(self, dedup_key: Tuple) -> Optional[DownloadTask]:
+        """查找内存中可以合并的已有任务，调用方必须持有lock"""
+        task_id = self.dedup_index.get(dedup_key)
+        task = (self.tasks.get(task_id) or self.archiving.get(task_id)) if task_id else None
+        if task is None:
+            self.dedup_index.pop(dedup_key, None)
+            return None
+            
+        if task.status in ("pending", "downloading", "processing"):
+            return task
+            
+        if task.status == "completed" and self._output_exists(task.result):
+            return task
+                
+        return None
+    
+    def _find_archived(self, dedup_key: Tuple) -> Optional[str]:
+        """查找可以合并的已归档的已完成任务，返回任务ID，调用方不应持有lock(需要读取归档文件)"""
+        if self.archive is None:
+            return None
+        record = self.archive.find_completed(dedup_key)
+        if record is None or not self._output_exists(record.get("result")):
+            return None
+        return record["task_id"]
+    
+    @staticmethod
+    def _output_exists(result) -> bool:
+        """已完成任务的输出文件是否仍然存在，文件已被删除时应重新下载"""
+        save_path = result.get("save_path") if isinstance(result, dict) else None
+        return not save_path or os.path.exists(save_path)
         
     def cancel_task(self, task_id: str) -> bool:
-        """取消下载任务"""
+        """
+        取消下载任务
+        
+        Args:
+            task_id: 任务ID
+            
+        Returns:
+            bool: 任务是否存在且尚未结束
+        """
+        return self.cancel_many([task_id]) == 1
+    
+    def cancel_many(self, task_ids: Iterable[str]) -> int:
+        """
+        批量取消下载任务
+        
+        等待中的任务立即从调度队列中移除；运行中的任务设置取消令牌并停止下载器，
+        停止下载器时不持有管理器的锁
+        
+        Args:
+            task_ids: 任务ID
+            
+        Returns:
+            int: 实际取消的任务数
+        """
+        canceled = []
+        with self.condition:
+            for task_id in task_ids:
+                task = self.tasks.get(task_id)
+                if task is None or task.status not in ("pending", "downloading", "processing"):
+                    continue
+                if task.status == "pending":
+                    self.queue.remove(task_id)
+                elif task.status == "downloading":
+                    # 立即释放下载槽位
+                    self.active_tasks.discard(task_id)
+                    self.condition.notify()
+                task.status = "canceled"
+                if task.token is not None:
+                    task.token.cancel()
+                canceled.append((task, task.downloader))
+                
+        for task, downloader in canceled:
+            if downloader is not None:
+                try:
+                    downloader.stop_download()
+                except Exception as e:
+                    logger.error(f"停止下载器失败: {task.task_id} - {str(e)}")
+            self._record_status(task.task_id, "canceled")
+            logger.info(f"取消下载任务: {task.task_id}")
+            self._notify(task.task_id, "canceled", 0)
+            self._on_task_finished(task)
+            
+        return len(canceled)
+    
+    def cancel_group(self, group: str) -> int:
+        """
+        取消任务组中所有未结束的任务
+        
+        Args:
+            group: 任务组
+            
+        Returns:
+            int: 实际取消的任务数
+        """
+        with self.lock:
+            task_ids = list(self.groups.get(group, ()))
+        return self.cancel_many(task_ids)
+    
+    def get_group_tasks(self, group: str) -> List[str]:
+        """获取任务组中仍在内存中的任务ID"""
         with self.lock:
-            if task_id not in self.tasks:
+            return list(self.groups.get(group, ()))
+    
+    def set_priority(self, task_id: str, priority: int) -> bool:
+        """
+        调整等待中任务的优先级
+        
+        Args:
+            task_id: 任务ID
+            priority: 新的优先级
+            
+        Returns:
+            bool: 任务是否仍在等待队列中并已调整
+        """
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is None or task.status != "pending":
                 return False
                 
-            task = self.tasks[task_id]
-            
-            # 如果任务正在下载中，停止下载
-            if task.status == "downloading" and task.downloader:
-                task.downloader.stop_download()
-                self.active_tasks.remove(task_id)
+            task.priority = priority
+            if not self.queue.update(task):
+                return False
                 
-            # 更新状态
-            task.status = "canceled"
-            logger.info(f"取消下载任务: {task_id}")
+        if self.journal:
+            self.journal.record_task({"task_id": task_id, "priority": priority})
             
-            if self.status_callback:
-                self.status_callback(task_id, "canceled", 0)
-                
-            return True
+        logger.info(f"调整任务优先级: {task_id} -> {priority}")
+        return True
+    
+    def set_max_concurrent(self, max_concurrent: int):
+        """
+        运行时调整最大并发数
+        
+        增加时立即启动新的工作线程；减少时多余的工作线程在完成当前任务后退出
+        
+        Args:
+            max_concurrent: 新的最大并发数
+        """
+        max_concurrent = max(1, int(max_concurrent))
+        
+        with self.condition:
+            old = self.max_concurrent
+            self.max_concurrent = max_concurrent
+            if self.is_running:
+                self._spawn_workers()
+            # 唤醒空闲线程，使其按新的并发数领取任务或退出
+            self.condition.notify_all()
+            
+        if old != max_concurrent:
+            logger.info(f"最大并发数调整: {old} -> {max_concurrent}")
+    
+    def set_bandwidth_limit(self, max_bandwidth: int):
+        """
+        运行时调整全局带宽上限
+        
+        Args:
+            max_bandwidth: 带宽上限（字节/秒），0表示不限速
+        """
+        self.bandwidth_limiter.set_rate(max_bandwidth)
+        logger.info(f"全局带宽上限调整为: {max_bandwidth or '不限速'}")
+    
+    def set_task_weight(self, task_id: str, weight: float) -> bool:
+        """
+        调整任务的带宽权重
+        
+        Args:
+            task_id: 任务ID
+            weight: 新的权重
+            
+        Returns:
+            bool: 任务是否存在
+        """
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is None:
+                return False
+            task.weight = weight
+            if task.status == "downloading":
+                self.bandwidth_limiter.set_weight(task_id, weight)
+            # 已结束的任务不在任务日志中，不再记录
+            if self.journal and task.status in ("pending", "downloading"):
+                self.journal.record_task({"task_id": task_id, "weight": weight})
+        return True
+    
+    def enable_adaptive_concurrency(self, min_concurrent: int = 1, max_concurrent: int = 8,
+                                    interval: float = 5.0):
+        """
+        启用自适应并发控制
+        
+        Args:
+            min_concurrent: 并发数下限
+            max_concurrent: 并发数上限
+            interval: 采样间隔（秒）
+        """
+        self.disable_adaptive_concurrency()
+        self.concurrency_controller = AdaptiveConcurrencyController(
+            self, min_concurrent=min_concurrent, max_concurrent=max_concurrent, interval=interval
+        )
+        self.concurrency_controller.start()
+    
+    def disable_adaptive_concurrency(self):
+        """停用自适应并发控制，保持当前并发数"""
+        if self.concurrency_controller:
+            self.concurrency_controller.stop()
+            self.concurrency_controller = None
+    
+    def get_load_sample(self) -> Dict:
+        """
+        获取当前负载采样
+        
+        Returns:
+            Dict: 包含时间戳、累计字节数、累计限流错误数、活动/等待任务数和最大并发数
+        """
+        with self.lock:
+            return {
+                "time": time.time(),
+                "bytes": self.bytes_downloaded,
+                "throttle_errors": self.throttle_errors,
+                "active": len(self.active_tasks),
+                "pending": len(self.queue),
+                "max_concurrent": self.max_concurrent
+            }
+    
+    def get_stage_depths(self) -> Dict:
+        """
+        获取流水线各阶段的队列深度
+        
+        Returns:
+            Dict: 网络阶段和后期处理阶段的等待数、执行数和并发上限
+        """
+        with self.lock:
+            return {
+                "network": {
+                    "queued": len(self.queue),
+                    "active": len(self.active_tasks),
+                    "limit": self.max_concurrent
+                },
+                "post_process": {
+                    "queued": self.post_queued,
+                    "active": self.post_active,
+                    "limit": self.post_process_workers
+                }
+            }
+    
+    def get_stats(self, task_id: Optional[str] = None) -> Optional[Dict]:
+        """
+        获取性能指标
+        
+        Args:
+            task_id: 任务ID，None表示获取所有任务的汇总
+            
+        Returns:
+            Optional[Dict]: 指定任务时为该任务的指标，任务不存在时返回None；
+                否则为汇总指标，包含已结束任务的各项指标统计、当前负载和各阶段队列深度
+        """
+        if task_id is not None:
+            task = self.tasks.get(task_id) or self.archiving.get(task_id)
+            if task is not None:
+                return task.metrics.to_dict(task.retries)
+            record = self.archive.get(task_id) if self.archive is not None else None
+            return record.get("metrics") if record else None
+            
+        stats = self.stats.to_dict()
+        stats["load"] = self.get_load_sample()
+        stats["stages"] = self.get_stage_depths()
+        return stats
+    
+    @staticmethod
+    def _output_size(result, default: int) -> int:
+        """输出文件的大小，无法获取时返回default"""
+        save_path = result.get("save_path") if isinstance(result, dict) else None
+        try:
+            return os.path.getsize(save_path) if save_path else default
+        except OSError:
+            return default
     
     def get_task(self, task_id: str) -> Optional[DownloadTask]:
-        """获取任务信息"""
-        return self.tasks.get(task_id)
+        """获取任务信息，包括已归档的任务"""
+        task = self.tasks.get(task_id) or self.archiving.get(task_id)
+        if task is None and self.archive is not None and task_id in self.archive:
+            record = self.archive.get(task_id)
+            if record:
+                task = DownloadTask.from_dict(record)
+        return task
     
     def get_all_tasks(self) -> List[DownloadTask]:
-        """获取所有任务"""
+        """获取内存中的所有任务(不含已归档的任务)"""
         with self.lock:
             return list(self.tasks.values())
     
+    def get_tasks(self, statuses: Optional[tuple] = None, limit: Optional[int] = None) -> List[DownloadTask]:
+        """
+        按状态获取内存中的任务，避免大批量时复制整个任务表
+        
+        Args:
+            statuses: 需要的状态，None表示全部
+            limit: 最多返回的任务数
+            
+        Returns:
+            List[DownloadTask]: 任务列表
+        """
+        result = []
+        with self.lock:
+            for task in self.tasks.values():
+                if statuses is None or task.status in statuses:
+                    result.append(task)
+                    if limit is not None and len(result) >= limit:
+                        break
+        return result
+    
+    def get_task_counts(self) -> Dict[str, int]:
+        """
+        统计各状态的任务数
+        
+        Returns:
+            Dict[str, int]: 状态 -> 任务数，archived为已归档的任务数
+        """
+        counts = {}
+        with self.lock:
+            for task in self.tasks.values():
+                counts[task.status] = counts.get(task.status, 0) + 1
+        counts["archived"] = len(self.archive) if self.archive is not None else 0
+        return counts
+    
+    def _on_task_finished(self, task: DownloadTask):
+        """任务结束后释放下载器，累加性能指标，并按保留策略归档较早结束的任务"""
+        task.downloader = None
+        task.token = None
+        # 完成和失败已记录到熔断器，被取消的探测任务释放探测资格
+        self.circuit_breaker.release_probe(task.task_id)
+        self.stats.add(task.status, task.metrics.to_dict(task.retries))
+        if self.max_finished_tasks is None:
+            with self.lock:
+                self.prefetched.discard(task.task_id)
+            return
+            
+        evicted = []
+        with self.lock:
+            self.prefetched.discard(task.task_id)
+            self.finished_tasks.append(task.task_id)
+            while len(self.finished_tasks) > self.max_finished_tasks:
+                evicted_task = self._evict_task(self.finished_tasks.popleft())
+                if evicted_task is not None:
+                    evicted.append(evicted_task)
+        
+        # 写入归档文件时不持有锁
+        self._archive_tasks(evicted)
+    
+    def _evict_task(self, task_id: str) -> Optional[DownloadTask]:
+        """
+        把已结束的任务移出任务表，调用方必须持有lock
+        
+        Returns:
+            Optional[DownloadTask]: 需要写入归档的任务，由调用方释放锁后交给_archive_tasks
+        """
+        task = self.tasks.get(task_id)
+        if task is None or task.status not in ("completed", "failed", "canceled"):
+            return None
+            
+        del self.tasks[task_id]
+        
+        if task.group is not None:
+            members = self.groups.get(task.group)
+            if members is not None:
+                members.discard(task_id)
+                if not members:
+                    del self.groups[task.group]
+        
+        if self.archive is not None:
+            self.archiving[task_id] = task
+            return task
+        self._drop_dedup_key(task)
+        return None
+    
+    def _archive_tasks(self, tasks: List[DownloadTask]):
+        """把移出任务表的任务写入归档，调用方不应持有lock"""
+        if not tasks:
+            return
+        for task in tasks:
+            self.archive.add(task.to_record())
+        with self.lock:
+            for task in tasks:
+                self.archiving.pop(task.task_id, None)
+                self._drop_dedup_key(task)
+    
+    def _drop_dedup_key(self, task: DownloadTask):
+        """
+        从内存中的去重索引移除任务，调用方必须持有lock
+        
+        已完成的任务归档后由归档按去重键查找，内存中的去重索引只保留内存中的任务
+        """
+        if task.dedup_key and self.dedup_index.get(task.dedup_key) == task.task_id:
+            del self.dedup_index[task.dedup_key]
+    
     def _ensure_workers(self):
         """确保工作线程在运行"""
         with self.lock:
             if not self.is_running:
                 self.is_running = True
-                
-                # 创建工作线程
-                for _ in range(self.max_concurrent):
-                    worker = threading.Thread(target=self._worker_loop, daemon=True)
-                    worker.start()
-                    self.workers.append(worker)
-                    
-                logger.debug(f"启动{self.max_concurrent}个下载工作线程")
+                if self.post_executor is None:
+                    self.post_executor = ThreadPoolExecutor(max_workers=self.post_process_workers)
+                if self.prefetch_depth and self.prefetch_executor is None:
+                    self.prefetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS)
+                self._spawn_workers()
     
-    def _worker_loop(self):
-        """工作线程循环"""
+    def _spawn_workers(self):
+        """补足工作线程到最大并发数，调用方必须持有lock"""
+        count = self.max_concurrent - len(self.workers)
+        for _ in range(count):
+            worker = threading.Thread(target=self._worker_loop, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+            
+        if count > 0:
+            logger.debug(f"启动{count}个下载工作线程")
+    
+    def _next_task(self) -> Optional[DownloadTask]:
+        """
+        等待并取出下一个可执行的任务，调用方必须持有condition
+        
+        Returns:
+            Optional[DownloadTask]: 下一个任务，管理器关闭或当前线程需要退出时返回None
+        """
         while self.is_running:
-            try:
-                # 获取任务ID
-                try:
-                    task_id = self.queue.get(timeout=1)
-                except queue.Empty:
+            # 并发数减少后，多余的工作线程退出
+            if len(self.workers) > self.max_concurrent:
+                return None
+                
+            # 到期的重试任务重新进入等待队列
+            timeout = self._promote_delayed()
+            
+            # 熔断期间暂停派发，冷却结束后放行一个探测任务
+            if self.queue and len(self.active_tasks) < self.max_concurrent:
+                blocked = self.circuit_breaker.retry_after()
+                if blocked > 0:
+                    timeout = blocked if timeout is None else min(timeout, blocked)
+                    self.condition.wait(timeout)
                     continue
                     
-                with self.lock:
-                    # 检查是否已达到最大并发数
-                    if len(self.active_tasks) >= self.max_concurrent:
-                        # 放回队列
-                        self.queue.put(task_id)
-                        time.sleep(0.5)
-                        continue
-                        
-                    # 检查任务是否存在
-                    if task_id not in self.tasks:
-                        self.queue.task_done()
-                        continue
-                        
-                    # 获取任务
-                    task = self.tasks[task_id]
+            if self.queue and len(self.active_tasks) < self.max_concurrent:
+                task_id = self.queue.pop()
+                task = self.tasks.get(task_id)
+                
+                # 跳过已删除或已取消的任务
+                if task is None or task.status != "pending":
+                    continue
                     
-                    # 检查任务状态
-                    if task.status != "pending":
-                        self.queue.task_done()
-                        continue
-                        
-                    # 将任务加入活动集合
-                    self.active_tasks.add(task_id)
+                # 熔断的主机处于半开状态时，该任务作为探测请求
+                self.circuit_breaker.assign_probe(task_id)
+                # 队列前移，为新进入预取范围的任务预取
+                self._schedule_prefetch()
+                return task
+                
+            # 没有任务或没有空闲槽位，等待add_task/任务结束/shutdown唤醒，或等到下一个重试任务到期
+            self.condition.wait(timeout)
+            
+        return None
+    
+    def _schedule_prefetch(self):
+        """为队列中接下来的prefetch_depth个任务提交预取，调用方必须持有lock"""
+        if not self.prefetch_depth or self.prefetch_executor is None:
+            return
+        for task_id in self.queue.peek(self.prefetch_depth):
+            task = self.tasks.get(task_id)
+            if task is None or task_id in self.prefetched:
+                continue
+            self.prefetched.add(task_id)
+            self.prefetch_executor.submit(self._prefetch, task)
+    
+    def _prefetch(self, task: DownloadTask):
+        """解析任务的视频信息和视频流地址，写入cache_manager"""
+        if task.status != "pending":
+            return
+        try:
+            keys = prefetch_video(task.url, QualityManager.get_quality_code(task.quality))
+        except Exception as e:
+            # 预取失败不影响任务，下载器开始时自行解析
+            logger.debug(f"预取元数据失败: {task.task_id} - {str(e)}")
+            return
+        if task.metadata_key is None:
+            task.metadata_key = keys["metadata_key"]
+        task.playurl_key = keys["playurl_key"]
+        logger.debug(f"已预取元数据: {task.task_id}")
+    
+    def _promote_delayed(self) -> Optional[float]:
+        """
+        把到期的重试任务放回等待队列，调用方必须持有lock
+        
+        Returns:
+            Optional[float]: 距下一个重试任务到期的秒数，没有时返回None
+        """
+        now = time.time()
+        while self.delayed and self.delayed[0][0] <= now:
+            _, _, task_id = heapq.heappop(self.delayed)
+            task = self.tasks.get(task_id)
+            if task is not None and task.status == "pending":
+                self.queue.push(task)
+        return self.delayed[0][0] - now if self.delayed else None
+    
+    def _worker_loop(self):
+        """工作线程循环"""
+        while True:
+            with self.condition:
+                task = self._next_task()
+                if task is None:
+                    self.workers.remove(threading.current_thread())
+                    return
                     
+                # 将任务加入活动集合
+                self.active_tasks.add(task.task_id)
+                
                 # 设置任务状态
                 task.status = "downloading"
                 task.start_time = time.time()
+                task.metrics.mark_dispatched()
+                task.token = CancellationToken()
                 
-                # 通知状态更新
-                if self.status_callback:
-                    self.status_callback(task_id, "downloading", 0)
-                    
-                logger.info(f"开始下载任务: {task_id} - {task.url}")
-                
-                # 创建下载器
-                def progress_callback(current_bytes):
-                    if task.downloader and hasattr(task.downloader, 'total_size') and task.downloader.total_size > 0:
-                        progress = min(99, int(current_bytes * 100 / task.downloader.total_size))
-                        task.progress = progress
-                        if self.status_callback:
-                            self.status_callback(task_id, "downloading", progress)
-                
-                task.downloader = create_downloader(progress_callback=progress_callback)
-                
-                # 执行下载
-                try:
-                    result = task.downloader.download_video(
-                        url=task.url,
-                        save_dir=task.save_dir,
-                        quality=task.quality
-                    )
-                    
-                    # 更新任务状态
-                    task.status = "completed"
-                    task.end_time = time.time()
-                    task.result = result
-                    task.progress = 100
-                    
-                    # 通知状态更新
-                    if self.status_callback:
-                        self.status_callback(task_id, "completed", 100, result)
-                        
-                    logger.info(f"下载任务完成: {task_id}")
-                    
-                except Exception as e:
-                    # 更新任务状态
-                    task.status = "failed"
-                    task.end_time = time.time()
-                    task.error = str(e)
-                    
-                    # 通知状态更新
-                    if self.status_callback:
-                        self.status_callback(task_id, "failed", task.progress, None, str(e))
-                        
-                    logger.error(f"下载任务失败: {task_id} - {str(e)}")
-                    
-                finally:
-                    # 从活动任务中移除
-                    with self.lock:
-                        if task_id in self.active_tasks:
-                            self.active_tasks.remove(task_id)
-                    
-                    # 标记队列任务完成
-                    self.queue.task_done()
-                
+            self._record_status(task.task_id, "downloading")
+            
+            try:
+                self._run_task(task)
             except Exception as e:
                 logger.error(f"工作线程异常: {str(e)}")
-                time.sleep(1)  # 防止异常情况下CPU占用过高
+            finally:
+                # 从活动任务中移除，并唤醒等待槽位的工作线程
+                with self.condition:
+                    self.active_tasks.discard(task.task_id)
+                    self.condition.notify()
+    
+    def _run_task(self, task: DownloadTask):
+        """执行单个下载任务"""
+        task_id = task.task_id
+        
+        # 通知状态更新
+        self._notify(task_id, "downloading", 0)
+            
+        logger.info(f"开始下载任务: {task_id} - {task.url}")
+        
+        # 任务结束时会释放令牌，这里保留引用
+        token = task.token
+        
+        # 创建下载器
+        def progress_callback(current_bytes):
+            # 下载器每个分块都会回调，任务取消后在这里中断下载
+            token.raise_if_canceled()
+            delta = current_bytes - task.downloaded_bytes
+            task.downloaded_bytes = current_bytes
+            if delta > 0:
+                task.metrics.add_bytes(delta)
+                with self.lock:
+                    self.bytes_downloaded += delta
+                # 下载器自身不支持限速时，在其分块读取循环调用的回调中阻塞，实现全局限速
+                if not limited_by_downloader:
+                    self.bandwidth_limiter.consume(task_id, delta, cancel_event=token)
+            total_size = getattr(task.downloader, 'total_size', 0)
+            if not total_size:
+                return
+            progress = min(99, current_bytes * 100 // total_size)
+            if progress == task.progress:
+                return
+            task.progress = progress
+            # 进度变化且距上次通知超过最小间隔时才通知
+            if self.progress_coalescer.update(task_id, progress):
+                self._notify(task_id, "downloading", progress)
+        
+        # 以下可选接口的约定见AbstractDownloader，不继承它的下载器按是否具有对应属性判断
+        task.downloader = create_downloader(progress_callback=progress_callback)
+        limited_by_downloader = getattr(task.downloader, 'limits_bandwidth',
+                                        hasattr(task.downloader, 'bandwidth_limiter'))
+        if limited_by_downloader:
+            task.downloader.bandwidth_limiter = self.bandwidth_limiter
+        self.bandwidth_limiter.register(task_id, task.weight)
+        if hasattr(task.downloader, 'cancellation_event'):
+            # AbstractDownloader子类在分块之间自行检查取消令牌
+            task.downloader.cancellation_event = token
+        if task.metadata_key and hasattr(task.downloader, 'video_info'):
+            # 同组任务已解析过视频信息时，下载器不必重新请求视频信息接口
+            video_info = cache_manager.get(task.metadata_key)
+            if video_info is not None:
+                task.downloader.video_info = video_info
+        if task.playurl_key and hasattr(task.downloader, 'play_info'):
+            # 预取的视频流地址未过期时，下载器不必再请求playurl接口
+            play_info = cache_manager.get(task.playurl_key)
+            if play_info is not None:
+                task.downloader.play_info = play_info
+        if hasattr(task.downloader, 'stage_callback'):
+            # 下载器解析完元数据后回调，用于统计元数据解析耗时
+            task.downloader.stage_callback = task.metrics.mark_stage
+        if task.retries > 0 and hasattr(task.downloader, 'resume'):
+            # 重试时尽量续传已下载的部分
+            task.downloader.resume = True
+        
+        # 网络阶段
+        try:
+            # 创建下载器期间任务可能已被取消
+            token.raise_if_canceled()
+            if hasattr(task.downloader, 'download_streams'):
+                # 下载器支持分阶段下载时，只在下载槽位中下载音视频流，合并交给后期处理阶段
+                streams = task.downloader.download_streams(
+                    url=task.url,
+                    save_dir=task.save_dir,
+                    quality=task.quality
+                )
+            else:
+                streams = task.downloader.download_video(
+                    url=task.url,
+                    save_dir=task.save_dir,
+                    quality=task.quality
+                )
+            # 下载器在写入时计算的流摘要记录到结果中，随任务归档
+            digests = getattr(task.downloader, 'digests', None)
+            if digests and isinstance(streams, dict):
+                streams.setdefault("digests", digests)
+        except Exception as e:
+            self._fail_task(task, e)
+            return
+        finally:
+            task.metrics.mark_network_end()
+            self.bandwidth_limiter.unregister(task_id)
+            # 网络阶段结束后下载器归还到池中，供后续任务复用
+            with self.lock:
+                downloader, task.downloader = task.downloader, None
+                # 取消和关闭会在锁外停止下载器，这样的下载器不放回池中，以免停止了复用它的任务
+                reusable = task.status != "canceled" and self.is_running
+            if reusable:
+                release_downloader(downloader)
+            
+        if not (isinstance(streams, dict) and streams.get("needs_merge")):
+            self._complete_task(task, streams)
+            return
+            
+        # 进入后期处理阶段，当前工作线程返回后即可领取下一个下载任务
+        with self.lock:
+            if task.status == "canceled":
+                return
+            task.status = "processing"
+            self.post_queued += 1
+        self._record_status(task_id, "processing")
+        self._notify(task_id, "processing", 99)
+        self.post_executor.submit(self._post_process, task, streams)
+    
+    def _post_process(self, task: DownloadTask, streams: Dict):
+        """后期处理阶段，在独立线程池中合并音视频"""
+        with self.lock:
+            self.post_queued -= 1
+            if task.status == "canceled" or not self.is_running:
+                self.circuit_breaker.release_probe(task.task_id)
+                return
+            self.post_active += 1
+            
+        try:
+            task.metrics.mark_merge_start()
+            result = process_streams(streams)
+            task.metrics.mark_merge_end()
+            self._complete_task(task, result)
+        except Exception as e:
+            # 合并失败重新下载没有意义，不再重试
+            self._fail_task(task, e, retryable=False)
+        finally:
+            with self.lock:
+                self.post_active -= 1
+    
+    def _complete_task(self, task: DownloadTask, result):
+        """标记任务完成，任务已被取消时不做任何处理"""
+        task_id = task.task_id
+        
+        # 更新任务状态，与cancel_many互斥，取消后完成的任务不会被改回completed
+        with self.lock:
+            if task.status == "canceled":
+                return
+            task.status = "completed"
+            task.end_time = time.time()
+            task.result = result
+            task.progress = 100
+        task.metrics.bytes_written = self._output_size(result, task.metrics.attempt_bytes)
+        self._record_status(task_id, "completed")
+        self.circuit_breaker.record_success()
+        
+        # 通知状态更新
+        self._notify(task_id, "completed", 100, result)
+            
+        logger.info(f"下载任务完成: {task_id}")
+        self._on_task_finished(task)
+    
+    def _fail_task(self, task: DownloadTask, error: Exception, retryable: bool = True):
+        """标记任务失败，可恢复的错误重新排队重试"""
+        task_id = task.task_id
+        
+        with self.lock:
+            stopped = task.status == "canceled"
+            if stopped:
+                task.end_time = time.time()
+        if stopped:
+            # 任务已被取消或管理器正在关闭，停止下载引发的异常不视为失败
+            logger.info(f"下载任务已停止: {task_id}")
+            return
+            
+        task.error = str(error)
+        
+        # 403/412限流错误(按响应的状态码判断)计入熔断器
+        response_url = getattr(getattr(error, 'response', None), 'url', None)
+        if is_throttled(error):
+            with self.lock:
+                self.throttle_errors += 1
+            host = extract_host(response_url or task.error, task.url)
+            if self.circuit_breaker.record_failure(host):
+                logger.warning(f"主机{host}连续被限流，暂停派发新任务")
+        elif response_url:
+            # 其他HTTP错误只说明返回响应的主机可以访问，不影响其他主机的熔断状态和连续失败次数
+            self.circuit_breaker.record_success(extract_host(response_url))
+            
+        _, _, is_fatal = analyze_error(error)
+        if retryable and not is_fatal and task.retries < self.max_retries and self.is_running:
+            self._schedule_retry(task)
+            return
+            
+        # 更新任务状态，期间被取消的任务保持canceled
+        with self.lock:
+            if task.status == "canceled":
+                return
+            task.status = "failed"
+            task.end_time = time.time()
+        self._record_status(task_id, "failed")
+        
+        # 通知状态更新
+        self._notify(task_id, "failed", task.progress, None, str(error))
+            
+        logger.error(f"下载任务失败: {task_id} - {str(error)}")
+        self._on_task_finished(task)
+        
+    def _schedule_retry(self, task: DownloadTask):
+        """按带抖动的指数退避安排重试，任务已被取消时不再重试"""
+        with self.condition:
+            if task.status == "canceled":
+                return
+            # 作为探测请求的任务被其他主机限流或遇到其他错误时，释放探测资格，
+            # 否则半开的主机一直等待探测结果，包括该任务本身在内的所有任务都不再派发
+            self.circuit_breaker.release_probe(task.task_id)
+            task.retries += 1
+            delay = min(self.max_retry_delay, self.retry_delay * (2 ** (task.retries - 1)))
+            delay *= random.uniform(0.5, 1.5)
+            task.status = "pending"
+            # 下一次下载重新从0开始报告字节数
+            task.downloaded_bytes = 0
+            due = time.time() + delay
+            heapq.heappush(self.delayed, [due, next(self._delayed_counter), task.task_id])
+            # 退避时间不计入排队等待
+            task.metrics.mark_enqueued(due)
+            self.condition.notify()
+            
+        if self.journal:
+            self.journal.record_task({"task_id": task.task_id, "retries": task.retries})
+        self._record_status(task.task_id, "pending")
+        self._notify(task.task_id, "pending", task.progress)
+        
+        logger.warning(f"下载任务将在{delay:.1f}秒后第{task.retries}次重试: {task.task_id} - {task.error}")
         
     def shutdown(self):
         """关闭下载管理器"""
         logger.info("正在关闭下载管理器...")
-        self.is_running = False
+        self.disable_adaptive_concurrency()
+        self.progress_coalescer.stop()
+        
+        with self.condition:
+            self.is_running = False
+            # 立即唤醒所有空闲的工作线程，使其退出
+            self.condition.notify_all()
         
-        # 取消所有活动任务
+        # 停止所有活动任务，任务日志中保留其下载中状态，重启后重新下载
         with self.lock:
+            stopping = []
             for task_id in list(self.active_tasks):
-                self.cancel_task(task_id)
+                task = self.tasks[task_id]
+                task.status = "canceled"
+                if task.token is not None:
+                    task.token.cancel()
+                stopping.append((task_id, task.downloader))
                 
-        # 清空队列
-        while not self.queue.empty():
-            try:
-                self.queue.get_nowait()
-                self.queue.task_done()
-            except queue.Empty:
-                break
+            # 清空队列，等待重试的任务在任务日志中仍为等待状态，重启后恢复
+            self.queue = create_policy(self.queue.name)
+            self.delayed = []
+            
+        for task_id, downloader in stopping:
+            self.circuit_breaker.release_probe(task_id)
+            if downloader is not None:
+                downloader.stop_download()
+            self._notify(task_id, "canceled", 0)
         
         # 等待所有工作线程结束
-        for worker in self.workers:
+        for worker in list(self.workers):
             if worker.is_alive():
                 worker.join(timeout=1)
                 
+        # 未开始的后期处理任务保留在任务日志中，重启后重新处理
+        if self.post_executor:
+            self.post_executor.shutdown(wait=False)
+            self.post_executor = None
+        if self.prefetch_executor:
+            self.prefetch_executor.shutdown(wait=False)
+            self.prefetch_executor = None
+                
+        if self.journal:
+            self.journal.close()
+            
         logger.info("下载管理器已关闭")
 
-# 创建全局下载管理器
-download_manager = DownloadManager()
+# 创建全局下载管理器，任务日志中的任务在调用start()或第一次添加任务时恢复
+download_manager = DownloadManager(journal_path=TASK_JOURNAL_FILE,
+                                   max_bandwidth=DEFAULT_CONFIG.get("max_bandwidth", 0),
+                                   max_finished_tasks=DEFAULT_CONFIG.get("max_finished_tasks", 1000),
+                                   archive_path=TASK_ARCHIVE_FILE,
+                                   prefetch_depth=DEFAULT_CONFIG.get("prefetch_depth", 3))
@@ -1,20 +1,115 @@
 """
 下载器工厂，根据需求创建合适的下载器实例
+
+- 下载器实例放回池中复用，会话、已解析的视频信息等缓存保持可用，不必每个任务重新创建
+- 每次借出时只设置本次任务的参数，归还时恢复为创建时的值，上一个任务的回调和取消令牌不会残留
+- 单个流按大小选择下载策略: 小流单连接下载，大流分段并行下载
 """
-from typing import Optional, Callable
+import threading
+import weakref
+from typing import Callable, Dict, List, Optional
+
+from config import get_config_value
+from content_store import get_content_store
 from downloader import VideoDownloader
+from http_session import get_session
+from logger import logger
+from segmented_downloader import STRATEGY_SINGLE, StreamDownloader, select_strategy
+
+# 每种下载器在池中保留的空闲实例数
+DEFAULT_POOL_SIZE = 4
+
+# 每个任务单独设置或产生的属性，归还时恢复为创建时的值；
+# total_size和digests是上一次下载的结果，不恢复时会计入下一个任务的进度和结果
+JOB_ATTRIBUTES = ("progress_callback", "cancellation_event", "stage_callback", "video_info",
+                  "play_info", "resume", "bandwidth_limiter", "total_size", "digests")
+
+# 空闲实例，按use_enhanced分开
+_pools: Dict[bool, List] = {True: [], False: []}
+_pool_lock = threading.Lock()
+
+# 实例 -> (use_enhanced, 创建时的任务属性)，未归还的实例被回收后自动移除
+_defaults = weakref.WeakKeyDictionary()
+
+def _new_downloader(use_enhanced: bool):
+    """创建下载器实例并记录任务属性的初始值"""
+    downloader = VideoDownloader()
+
+    # 使用全局共享会话，复用连接池和登录cookie
+    if hasattr(downloader, 'session'):
+        downloader.session = get_session()
+    if hasattr(downloader, 'content_store') and get_config_value("content_store_enabled", True):
+        # 已下载过的流从内容存储中复用
+        downloader.content_store = get_content_store()
+    if hasattr(downloader, 'strategy'):
+        # 不使用增强特性时所有流都单连接下载，否则按流的大小选择
+        downloader.strategy = None if use_enhanced else STRATEGY_SINGLE
+
+    attributes = {name: getattr(downloader, name) for name in JOB_ATTRIBUTES if hasattr(downloader, name)}
+    _defaults[downloader] = (use_enhanced, attributes)
+    return downloader
 
 def create_downloader(progress_callback: Optional[Callable] = None, use_enhanced: bool = True):
     """
-    创建下载器实例
-    
+    从池中借出下载器实例，池为空时创建新实例
+
+    用完后应调用release_downloader归还，不归还的实例只是不能被复用
+
     Args:
         progress_callback: 进度回调函数
-        use_enhanced: 是否使用增强特性 (参数保留但不再需要切换不同下载器)
-        
+        use_enhanced: 是否使用增强特性(分段并行下载、CDN节点选择)，为False时单连接下载
+
     Returns:
         下载器实例，具有download_video方法
     """
-    # 由于增强功能已经合并到VideoDownloader中，直接返回该实例
-    print("Info - 使用B站下载器 (已包含403错误修复功能)")
-    return VideoDownloader(progress_callback=progress_callback)
+    with _pool_lock:
+        pool = _pools[use_enhanced]
+        downloader = pool.pop() if pool else None
+    if downloader is None:
+        downloader = _new_downloader(use_enhanced)
+        logger.debug(f"创建下载器实例: {type(downloader).__name__} (增强特性: {use_enhanced})")
+    downloader.progress_callback = progress_callback
+    return downloader
+
+def release_downloader(downloader) -> None:
+    """
+    归还下载器实例，恢复任务属性后放回池中，池已满时丢弃
+
+    Args:
+        downloader: create_downloader借出的实例
+    """
+    if downloader is None or getattr(downloader, 'is_downloading', False):
+        # 仍在下载的实例(例如停止尚未生效)不放回池中
+        return
+    with _pool_lock:
+        record = _defaults.get(downloader)
+        if record is None:
+            return
+        use_enhanced, attributes = record
+        for name, value in attributes.items():
+            setattr(downloader, name, value)
+        pool = _pools[use_enhanced]
+        if downloader in pool:
+            return
+        if len(pool) < int(get_config_value("downloader_pool_size", DEFAULT_POOL_SIZE)):
+            pool.append(downloader)
+        else:
+            del _defaults[downloader]
+
+def create_stream_downloader(content_length: Optional[int] = None, **kwargs) -> StreamDownloader:
+    """
+    创建单个流的下载器，已知流的大小时据此选择下载策略，否则在探测到大小后选择
+
+    Args:
+        content_length: 流的大小(Content-Length)
+        **kwargs: 传给StreamDownloader的参数
+
+    Returns:
+        StreamDownloader: 流下载器
+    """
+    if content_length and 'strategy' not in kwargs:
+        kwargs['strategy'] = select_strategy(content_length)
+    kwargs.setdefault('session', get_session())
+    if 'content_store' not in kwargs and get_config_value("content_store_enabled", True):
+        kwargs['content_store'] = get_content_store()
+    return StreamDownloader(**kwargs)
@@ -3,7 +3,56 @@
 """
 import re
 import traceback
-from typing import Tuple
+from typing import Optional, Tuple
+
+# 表示被限流的HTTP状态码
+THROTTLE_STATUS_CODES = (403, 412)
+
+# 没有状态码属性的异常从错误信息中识别状态码，只匹配"HTTP 403"、"403 Forbidden"这样的写法，
+# 不会匹配视频流URL中的deadline参数或字节数
+_STATUS_TEXT_PATTERN = re.compile(r'\bHTTP\s*(403|412)\b|\b(403|412) (?:Forbidden|Precondition)')
+
+class HTTPStatusError(Exception):
+    """带HTTP状态码的错误，下载器和接口封装自身的错误时使用"""
+    
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+def get_status_code(error: BaseException) -> Optional[int]:
+    """
+    获取异常对应的HTTP状态码
+    
+    requests.HTTPError使用响应的状态码，其他异常使用status_code属性；
+    异常由其他异常引发(raise ... from)时沿原因链查找。都没有时从错误信息中识别403和412，
+    只接受_STATUS_TEXT_PATTERN的写法(视频流URL和字节数中也会出现403、412等数字)
+    
+    Args:
+        error: 发生的异常
+        
+    Returns:
+        Optional[int]: HTTP状态码，没有时返回None
+    """
+    message = str(error)
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        response = getattr(error, 'response', None)
+        status = getattr(response, 'status_code', None)
+        if status is None:
+            status = getattr(error, 'status_code', None)
+        if isinstance(status, int):
+            return status
+        error = error.__cause__
+        
+    match = _STATUS_TEXT_PATTERN.search(message)
+    if match:
+        return int(match.group(1) or match.group(2))
+    return None
+
+def is_throttled(error: BaseException) -> bool:
+    """是否为403/412限流错误"""
+    return get_status_code(error) in THROTTLE_STATUS_CODES
 
 def analyze_error(error: Exception) -> Tuple[str, str, bool]:
     """
@@ -17,6 +66,7 @@ def analyze_error(error: Exception) -> Tuple[str, str, bool]:
     """
     error_msg = str(error)
     error_type = type(error).__name__
+    status_code = get_status_code(error)
     stack_trace = traceback.format_exc()
     is_fatal = True  # 默认认为是致命错误
     
@@ -27,11 +77,17 @@ def analyze_error(error: Exception) -> Tuple[str, str, bool]:
         is_fatal = False
     
     # 403权限错误
-    elif "403" in error_msg:
+    elif status_code == 403:
         title = "访问权限错误"
         detail = "服务器拒绝访问，可能是因为:\n1. Cookie失效或过期\n2. 请求过于频繁\n3. IP地址被限制\n\n建议重新登录或稍后再试。"
         is_fatal = False
     
+    # 412请求被拦截(风控限流)
+    elif status_code == 412:
+        title = "请求过于频繁"
+        detail = "服务器暂时拦截了请求(HTTP 412)，通常是请求过于频繁触发了风控。\n\n程序会自动放慢请求速度，请稍后再试。"
+        is_fatal = False
+    
     # 视频不存在
     elif "视频不存在" in error_msg or "获取视频信息失败" in error_msg:
         title = "视频不存在或已被删除"
@@ -0,0 +1,99 @@
+"""
+全局HTTP会话池，所有API请求、HEAD探测和媒体下载共享同一组连接
+
+- 进程内只有一个requests.Session，底层urllib3连接池是线程安全的，可以被多个下载线程同时使用
+- 按主机划分连接池，并限制每个主机的最大连接数，超出时等待空闲连接而不是新建连接
+- 保持长连接，复用TCP/TLS连接，避免每个请求重新握手
+- B站登录cookie只在创建会话时附加一次，且只发送给bilibili.com域名
+"""
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import BILIBILI_API, DEFAULT_CONFIG
+from cookie_manager import get_bilibili_cookies
+
+# 登录cookie的作用域，避免发送给CDN或第三方域名
+COOKIE_DOMAIN = ".bilibili.com"
+
+class SessionPool:
+    """HTTP会话池"""
+
+    def __init__(self, max_hosts: int = 16, max_connections_per_host: int = 16):
+        """
+        初始化会话池
+
+        Args:
+            max_hosts: 缓存连接池的主机数
+            max_connections_per_host: 每个主机的最大连接数
+        """
+        self.max_hosts = max_hosts
+        self.max_connections_per_host = max_connections_per_host
+        self.lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+
+    def get_session(self) -> requests.Session:
+        """
+        获取共享会话，首次调用时创建
+
+        Returns:
+            requests.Session: 共享会话
+        """
+        session = self._session
+        if session is None:
+            with self.lock:
+                if self._session is None:
+                    self._session = self._create_session()
+                session = self._session
+        return session
+
+    def refresh_cookies(self):
+        """登录信息变化后重新加载cookie"""
+        with self.lock:
+            if self._session is not None:
+                self._session.cookies.clear()
+                self._attach_cookies(self._session)
+
+    def close(self):
+        """关闭所有连接"""
+        with self.lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def _create_session(self) -> requests.Session:
+        """创建会话并配置连接池、请求头和cookie"""
+        session = requests.Session()
+
+        adapter = HTTPAdapter(
+            pool_connections=self.max_hosts,
+            pool_maxsize=self.max_connections_per_host,
+            pool_block=True  # 达到单主机连接上限时等待空闲连接
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        session.headers.update({
+            "User-Agent": BILIBILI_API["user_agent"],
+            "Accept-Language": BILIBILI_API["accept_language"],
+            "Referer": "https://www.bilibili.com",
+            "Connection": "keep-alive"
+        })
+
+        self._attach_cookies(session)
+        return session
+
+    @staticmethod
+    def _attach_cookies(session: requests.Session):
+        """附加B站登录cookie"""
+        for name, value in get_bilibili_cookies().items():
+            session.cookies.set(name, value, domain=COOKIE_DOMAIN)
+
+# 创建全局会话池
+session_pool = SessionPool(max_connections_per_host=DEFAULT_CONFIG.get("max_connections_per_host", 16))
+
+def get_session() -> requests.Session:
+    """获取全局共享的HTTP会话"""
+    return session_pool.get_session()
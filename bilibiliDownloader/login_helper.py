@@ -8,8 +8,8 @@ import time
 import tkinter as tk
 from tkinter import ttk, messagebox
 import webbrowser
-import requests
 from config import CONFIG_FILE, DEFAULT_CONFIG, save_user_config, load_user_config
+from http_session import get_session, session_pool
 
 class LoginHelper:
     def __init__(self, cli_mode=False):
@@ -230,6 +230,7 @@ class LoginHelper:
             
             # 保存到文件
             save_user_config(self.user_config)
+            session_pool.refresh_cookies()
             
             # 更新状态标签
             if hasattr(self, 'status_label'):
@@ -317,6 +318,7 @@ class LoginHelper:
             
             try:
                 save_user_config(self.user_config)
+                session_pool.refresh_cookies()
                 self.status_label.config(text="未登录", foreground="red")
                 messagebox.showinfo("成功", "登录信息已清除")
                 
@@ -351,9 +353,8 @@ class LoginHelper:
         print(f"Debug - 测试登录使用的cookies: SESSDATA长度={len(cookies['SESSDATA'])}, bili_jct长度={len(cookies['bili_jct'])}")
         
         try:
-            # 使用B站用户信息API测试登录状态
-            import requests
-            response = requests.get(
+            # 使用B站用户信息API测试登录状态，请求级cookie覆盖会话中的cookie
+            response = get_session().get(
                 "https://api.bilibili.com/x/web-interface/nav",
                 cookies=cookies,
                 timeout=10
@@ -466,6 +467,7 @@ class LoginHelper:
                 "last_updated": time.strftime("%Y-%m-%d %H:%M:%S")
             })
             save_user_config(self.user_config)
+            session_pool.refresh_cookies()
             
             print(f"Debug - 更新登录信息成功")
         except Exception as e:
@@ -501,6 +503,7 @@ class LoginHelper:
         # 保存配置
         try:
             save_user_config(self.user_config)
+            session_pool.refresh_cookies()
             print(f"\n✅ 登录凭证已保存!")
             
             # 更新全局配置
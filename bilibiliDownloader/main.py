@@ -113,6 +113,9 @@ def main():
                     quality=args.quality,
                     save_dir=args.output
                 )
+                # 下载器在写入时计算的流摘要一并记入历史
+                if getattr(downloader, 'digests', None):
+                    result.setdefault('digests', downloader.digests)
                 save_history(result)
                 
                 print(f"\n下载成功! 保存至: {result['save_path']}")
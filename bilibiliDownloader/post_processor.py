@@ -0,0 +1,78 @@
+"""
+后期处理模块，负责音视频合并等CPU密集型步骤
+
+下载管理器在网络阶段结束后把合并任务交给独立的线程池执行，下载槽位可以立即开始下一个任务
+"""
+import os
+import shutil
+import subprocess
+from typing import Dict
+
+from logger import logger
+
+def merge_audio_video(video_path: str, audio_path: str, output_path: str) -> str:
+    """
+    使用FFmpeg将视频流和音频流合并为一个文件(不重新编码)
+
+    Args:
+        video_path: 视频流文件路径
+        audio_path: 音频流文件路径
+        output_path: 输出文件路径
+
+    Returns:
+        str: 输出文件路径
+    """
+    if shutil.which('ffmpeg') is None:
+        raise Exception("未找到FFmpeg，无法合并视频和音频")
+
+    command = [
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-i', video_path,
+        '-i', audio_path,
+        '-c', 'copy',
+        output_path
+    ]
+    result = subprocess.run(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding='utf-8',
+        errors='ignore'
+    )
+    if result.returncode != 0:
+        raise Exception(f"FFmpeg合并失败: {result.stderr.strip()[:300]}")
+
+    return output_path
+
+def process_streams(streams: Dict) -> Dict:
+    """
+    处理网络阶段下载的流，生成最终结果
+
+    Args:
+        streams: 网络阶段的结果，需要合并时包含video_path、audio_path和output_path
+
+    Returns:
+        Dict: 下载结果，save_path为最终文件路径
+    """
+    result = dict(streams)
+    if not streams.get("needs_merge"):
+        return result
+
+    video_path = streams["video_path"]
+    audio_path = streams["audio_path"]
+    output_path = streams["output_path"]
+
+    logger.debug(f"合并音视频: {output_path}")
+    merge_audio_video(video_path, audio_path, output_path)
+
+    # 合并成功后删除中间文件
+    for path in (video_path, audio_path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    result["save_path"] = output_path
+    result["needs_merge"] = False
+    return result
@@ -0,0 +1,97 @@
+"""
+进度合并器，降低进度通知的频率
+
+下载器每读取一个分块就会回调一次进度，多线程小分块时每秒可达数千次。合并器:
+- 单任务通知: 只有进度百分比变化且距上次通知超过最小间隔时才通知，中间的变化合并到下一次通知
+- 批量通知: 后台线程按固定间隔把所有活动任务的最新进度一次性交给批量回调
+结束状态(完成、失败、取消)不经过合并器，总是立即通知
+"""
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from logger import logger
+
+class ProgressCoalescer:
+    """进度合并器"""
+
+    def __init__(self, min_interval: float = 0.1):
+        """
+        初始化进度合并器
+
+        Args:
+            min_interval: 同一任务两次进度通知的最小间隔（秒）
+        """
+        self.min_interval = min_interval
+        self._last_emit: Dict[str, float] = {}  # task_id -> 上次通知时间
+        self._dirty: Dict[str, int] = {}  # task_id -> 上次批量通知后的最新进度
+        self._batch_callback: Optional[Callable[[Dict[str, int]], None]] = None
+        self._batch_interval = 0.1
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def update(self, task_id: str, progress: int) -> bool:
+        """
+        记录任务的新进度(调用方保证进度已变化)
+
+        Args:
+            task_id: 任务ID
+            progress: 进度百分比
+
+        Returns:
+            bool: 是否应该立即发出单任务通知
+        """
+        if self._batch_callback is not None:
+            self._dirty[task_id] = progress
+
+        now = time.monotonic()
+        if now - self._last_emit.get(task_id, 0.0) < self.min_interval:
+            return False
+        self._last_emit[task_id] = now
+        return True
+
+    def forget(self, task_id: str):
+        """任务结束后清理状态"""
+        self._last_emit.pop(task_id, None)
+        self._dirty.pop(task_id, None)
+
+    def set_batch_callback(self, callback: Optional[Callable[[Dict[str, int]], None]], interval: float = 0.1):
+        """
+        设置批量进度回调
+
+        Args:
+            callback: 批量回调，参数为 {task_id: 进度百分比}，None表示取消
+            interval: 批量通知间隔（秒）
+        """
+        self._batch_interval = interval
+        self._batch_callback = callback
+        if callback is None:
+            self.stop()
+        elif self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止批量通知线程"""
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+        self._thread = None
+
+    def flush(self):
+        """立即发出一次批量通知"""
+        callback = self._batch_callback
+        if callback is None or not self._dirty:
+            return
+        # 替换而不是清空，下载线程写入时无需加锁；竞争中丢失的进度会在下一次变化时补上
+        dirty, self._dirty = self._dirty, {}
+        try:
+            callback(dirty)
+        except Exception as e:
+            logger.error(f"批量进度回调异常: {str(e)}")
+
+    def _flush_loop(self):
+        """批量通知循环"""
+        while not self._stop_event.wait(self._batch_interval):
+            self.flush()
@@ -0,0 +1,137 @@
+"""
+全局带宽限制器，基于令牌桶算法在所有下载任务和分段之间共享带宽上限
+
+每个下载任务(消费者)拥有独立的令牌桶，速率为 总速率 * 任务权重 / 所有活动任务权重之和，
+各任务按权重公平分配带宽，而不是先到先得；同一任务的多个分段共享该任务的令牌桶
+"""
+import threading
+import time
+from typing import Dict, Optional
+
+class _Bucket:
+    """单个消费者的令牌桶"""
+
+    __slots__ = ("weight", "rate", "tokens", "last")
+
+    def __init__(self, weight: float, now: float):
+        self.weight = weight
+        self.rate = 0.0
+        self.tokens = 0.0
+        self.last = now
+
+class BandwidthLimiter:
+    """带宽限制器"""
+
+    def __init__(self, rate: int = 0, burst_seconds: float = 0.5, min_burst: int = 64 * 1024):
+        """
+        初始化带宽限制器
+
+        Args:
+            rate: 总带宽上限（字节/秒），0表示不限速
+            burst_seconds: 令牌桶容量相当于多少秒的流量
+            min_burst: 令牌桶的最小容量（字节）
+        """
+        self.rate = max(0, rate or 0)
+        self.burst_seconds = burst_seconds
+        self.min_burst = min_burst
+        self.lock = threading.Lock()
+        self._buckets: Dict[str, _Bucket] = {}
+
+    def set_rate(self, rate: int):
+        """
+        运行时调整总带宽上限
+
+        Args:
+            rate: 总带宽上限（字节/秒），0表示不限速
+        """
+        with self.lock:
+            self._refill_all(time.monotonic())
+            self.rate = max(0, rate or 0)
+            self._rebalance()
+
+    def register(self, consumer_id: str, weight: float = 1.0):
+        """
+        注册消费者
+
+        Args:
+            consumer_id: 消费者ID，通常为任务ID
+            weight: 权重，权重越大分到的带宽越多
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill_all(now)
+            bucket = self._buckets.get(consumer_id)
+            if bucket is None:
+                self._buckets[consumer_id] = _Bucket(max(weight, 0.01), now)
+            else:
+                bucket.weight = max(weight, 0.01)
+            self._rebalance()
+
+    def set_weight(self, consumer_id: str, weight: float):
+        """调整消费者权重"""
+        self.register(consumer_id, weight)
+
+    def unregister(self, consumer_id: str):
+        """注销消费者，其带宽份额分配给其他活动消费者"""
+        with self.lock:
+            if self._buckets.pop(consumer_id, None) is not None:
+                self._refill_all(time.monotonic())
+                self._rebalance()
+
+    def consume(self, consumer_id: str, nbytes: int, cancel_event: Optional[threading.Event] = None):
+        """
+        消耗令牌，令牌不足时阻塞直到可以继续传输
+
+        Args:
+            consumer_id: 消费者ID
+            nbytes: 本次传输的字节数
+            cancel_event: 取消事件，设置后立即返回
+        """
+        if not self.rate or nbytes <= 0:
+            return
+
+        with self.lock:
+            bucket = self._buckets.get(consumer_id)
+            if bucket is None:
+                bucket = _Bucket(1.0, time.monotonic())
+                self._buckets[consumer_id] = bucket
+                self._rebalance()
+            self._refill(bucket, time.monotonic())
+            # 允许令牌为负(欠账)，之后按速率等待还清，单次传输可以大于桶容量
+            bucket.tokens -= nbytes
+
+        while True:
+            with self.lock:
+                if not self.rate or consumer_id not in self._buckets:
+                    return
+                self._refill(bucket, time.monotonic())
+                if bucket.tokens >= 0:
+                    return
+                wait = -bucket.tokens / bucket.rate if bucket.rate > 0 else 0.1
+
+            # 分段等待，使速率调整和取消能及时生效
+            wait = min(wait, 0.25)
+            if cancel_event is not None:
+                if cancel_event.wait(wait):
+                    return
+            else:
+                time.sleep(wait)
+
+    def _refill(self, bucket: _Bucket, now: float):
+        """补充令牌，调用方必须持有lock"""
+        elapsed = now - bucket.last
+        bucket.last = now
+        if elapsed > 0 and bucket.rate > 0:
+            capacity = max(bucket.rate * self.burst_seconds, self.min_burst)
+            bucket.tokens = min(capacity, bucket.tokens + bucket.rate * elapsed)
+
+    def _refill_all(self, now: float):
+        """按旧速率补充所有令牌桶，调用方必须持有lock"""
+        for bucket in self._buckets.values():
+            self._refill(bucket, now)
+
+    def _rebalance(self):
+        """按权重重新分配各消费者的速率，调用方必须持有lock"""
+        total_weight = sum(bucket.weight for bucket in self._buckets.values())
+        for bucket in self._buckets.values():
+            bucket.rate = self.rate * bucket.weight / total_weight if total_weight else 0.0
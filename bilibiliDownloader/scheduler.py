@@ -0,0 +1,269 @@
+"""
+任务调度策略，决定等待队列中任务的执行顺序
+
+支持的策略:
+- fifo: 先进先出
+- priority: 按显式优先级，数值越大越先执行，同优先级先进先出
+- sjf: 短任务优先，按已知的流大小排序，大小未知的任务排在最后
+- round_robin: 按UP主轮转，避免单个UP主的大批量任务占满队列
+"""
+import abc
+import heapq
+import itertools
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+class SchedulingPolicy(abc.ABC):
+    """调度策略抽象基类"""
+
+    name = ""
+
+    @abc.abstractmethod
+    def push(self, task) -> None:
+        """将任务加入等待队列"""
+        pass
+
+    @abc.abstractmethod
+    def pop(self) -> Optional[str]:
+        """取出下一个任务ID，队列为空时返回None"""
+        pass
+
+    @abc.abstractmethod
+    def peek(self, n: int) -> List[str]:
+        """按出队顺序返回接下来的最多n个任务ID，不改变队列"""
+        pass
+
+    @abc.abstractmethod
+    def remove(self, task_id: str) -> bool:
+        """从等待队列中移除任务，返回任务是否在队列中"""
+        pass
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    @abc.abstractmethod
+    def __contains__(self, task_id: str) -> bool:
+        pass
+
+    def update(self, task) -> bool:
+        """任务的调度属性(如优先级)变化后重新排队"""
+        if not self.remove(task.task_id):
+            return False
+        self.push(task)
+        return True
+
+class FIFOPolicy(SchedulingPolicy):
+    """先进先出策略"""
+
+    name = "fifo"
+
+    def __init__(self):
+        self._queue = OrderedDict()
+
+    def push(self, task) -> None:
+        self._queue[task.task_id] = None
+
+    def pop(self) -> Optional[str]:
+        if not self._queue:
+            return None
+        task_id, _ = self._queue.popitem(last=False)
+        return task_id
+
+    def peek(self, n: int) -> List[str]:
+        return list(itertools.islice(self._queue, n))
+
+    def remove(self, task_id: str) -> bool:
+        if task_id not in self._queue:
+            return False
+        del self._queue[task_id]
+        return True
+
+    def update(self, task) -> bool:
+        # FIFO不关心优先级，保持原有位置
+        return task.task_id in self._queue
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def __contains__(self, task_id: str) -> bool:
+        return task_id in self._queue
+
+class _HeapPolicy(SchedulingPolicy):
+    """
+    基于堆的策略基类
+
+    移除任务时只做标记(惰性删除)，出队时跳过，使remove为O(1)
+    """
+
+    _REMOVED = None
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}  # task_id -> [key, seq, task_id]
+        self._counter = itertools.count()
+
+    @abc.abstractmethod
+    def _key(self, task):
+        """排序键，越小越先执行"""
+        pass
+
+    def push(self, task) -> None:
+        self.remove(task.task_id)
+        entry = [self._key(task), next(self._counter), task.task_id]
+        self._entries[task.task_id] = entry
+        heapq.heappush(self._heap, entry)
+
+    def pop(self) -> Optional[str]:
+        while self._heap:
+            _, _, task_id = heapq.heappop(self._heap)
+            if task_id is not self._REMOVED:
+                del self._entries[task_id]
+                return task_id
+        return None
+
+    def peek(self, n: int) -> List[str]:
+        # 从堆顶按层展开，只访问最小的若干个节点及其子节点，与队列长度无关
+        heap = self._heap
+        result = []
+        frontier = [(heap[0], 0)] if heap else []
+        while frontier and len(result) < n:
+            entry, index = heapq.heappop(frontier)
+            if entry[-1] is not self._REMOVED:
+                result.append(entry[-1])
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+        return result
+
+    def remove(self, task_id: str) -> bool:
+        entry = self._entries.pop(task_id, None)
+        if entry is None:
+            return False
+        entry[-1] = self._REMOVED
+        # 大批量取消后已删除的条目占多数时重建堆，均摊后仍为O(1)
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = list(self._entries.values())
+            heapq.heapify(self._heap)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, task_id: str) -> bool:
+        return task_id in self._entries
+
+class PriorityPolicy(_HeapPolicy):
+    """显式优先级策略，数值越大越先执行"""
+
+    name = "priority"
+
+    def _key(self, task):
+        return -task.priority
+
+class ShortestJobFirstPolicy(_HeapPolicy):
+    """短任务优先策略，大小未知的任务排在最后，同等条件下按优先级"""
+
+    name = "sjf"
+
+    def _key(self, task):
+        size = task.size_hint if task.size_hint else float("inf")
+        return (size, -task.priority)
+
+class RoundRobinPolicy(SchedulingPolicy):
+    """按UP主轮转策略，每个UP主内部先进先出"""
+
+    name = "round_robin"
+
+    def __init__(self):
+        self._queues: Dict[str, OrderedDict] = {}  # uploader -> 任务队列
+        self._owners: Dict[str, str] = {}  # task_id -> uploader
+        self._rotation = deque()  # 轮转顺序
+
+    def push(self, task) -> None:
+        self.remove(task.task_id)
+        uploader = task.uploader or ""
+        if uploader not in self._queues:
+            self._queues[uploader] = OrderedDict()
+            self._rotation.append(uploader)
+        self._queues[uploader][task.task_id] = None
+        self._owners[task.task_id] = uploader
+
+    def pop(self) -> Optional[str]:
+        while self._rotation:
+            uploader = self._rotation.popleft()
+            tasks = self._queues[uploader]
+            if not tasks:
+                del self._queues[uploader]
+                continue
+            task_id, _ = tasks.popitem(last=False)
+            del self._owners[task_id]
+            if tasks:
+                self._rotation.append(uploader)
+            else:
+                del self._queues[uploader]
+            return task_id
+        return None
+
+    def peek(self, n: int) -> List[str]:
+        # 模拟轮转: 每轮从每个UP主的队列中各取下一个任务
+        cursors = [iter(self._queues[uploader]) for uploader in self._rotation if self._queues.get(uploader)]
+        result = []
+        while cursors and len(result) < n:
+            remaining = []
+            for cursor in cursors:
+                task_id = next(cursor, None)
+                if task_id is None:
+                    continue
+                result.append(task_id)
+                remaining.append(cursor)
+                if len(result) == n:
+                    break
+            cursors = remaining
+        return result
+
+    def remove(self, task_id: str) -> bool:
+        uploader = self._owners.pop(task_id, None)
+        if uploader is None:
+            return False
+        # 空队列留在轮转中，出队时再清理
+        del self._queues[uploader][task_id]
+        return True
+
+    def update(self, task) -> bool:
+        # 轮转顺序只与UP主有关，UP主未变化时保持原有位置
+        uploader = self._owners.get(task.task_id)
+        if uploader is None:
+            return False
+        if uploader != (task.uploader or ""):
+            self.remove(task.task_id)
+            self.push(task)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._owners)
+
+    def __contains__(self, task_id: str) -> bool:
+        return task_id in self._owners
+
+# 可选的调度策略
+POLICIES = {
+    FIFOPolicy.name: FIFOPolicy,
+    PriorityPolicy.name: PriorityPolicy,
+    ShortestJobFirstPolicy.name: ShortestJobFirstPolicy,
+    RoundRobinPolicy.name: RoundRobinPolicy,
+}
+
+def create_policy(name: str) -> SchedulingPolicy:
+    """
+    根据名称创建调度策略
+
+    Args:
+        name: 策略名称 (fifo, priority, sjf, round_robin)
+
+    Returns:
+        SchedulingPolicy: 调度策略实例
+    """
+    if name not in POLICIES:
+        raise ValueError(f"未知的调度策略: {name}，可选值: {', '.join(POLICIES)}")
+    return POLICIES[name]()
@@ -0,0 +1,776 @@
+"""
+分段下载器，把单个DASH音频或视频流按字节范围拆分，通过多个连接并行下载
+
+- 先用 Range: bytes=0-0 探测流的总大小和服务器是否支持范围请求，不支持时退化为单连接下载
+- 按thread_count把流平均拆分为多个分段，每个线程领取一个分段
+- 下载策略按总大小选择: 小于segmented_min_size的流只用一个连接(single)，其余按分段并行下载
+  (segmented)；调用方已知大小时传入size_hint，小流也不再并发探测CDN节点
+- 工作窃取: 线程完成自己的分段后，把剩余最多的分段从中间拆开，领取后半部分，
+  原线程下载到新的结束位置即停止，慢速连接上积压的数据会被其他线程分担
+- 所有连接来自共享HTTP会话的连接池，带宽限制器按任务统一限速
+
+断点续传: 下载过程中数据写入 <保存路径>.part，已完成的字节范围定期记录到旁边的 .part.json。
+重试或重启后，只要ETag和总大小与记录一致，就只请求缺少的字节范围；网络错误、取消、
+关闭程序或进程崩溃后都可以续传，最多重新下载最后一次记录之后的数据
+
+CDN节点: 传入backup_url时由CdnSelector选择起始节点；分段请求失败或单个连接的吞吐量持续低于
+min_speed时切换到下一个候选节点，已下载的数据保留，新节点从当前位置继续
+
+写入: .part文件按总大小预分配(posix_fallocate，不支持时ftruncate)，各分段用os.pwrite直接写入
+自己的偏移，数据不在内存中缓冲，也不需要事后拼接；没有pwrite的平台(Windows)加锁定位后写入
+
+完整性: 数据写入时按块计算SHA-256(见stream_integrity)，分段和窃取的拆分点对齐到块边界；
+同一个流(ETag和大小相同)之前下载过时，其摘要作为参考，每块写完立即比较，不一致的块换节点重新下载。
+续传时从文件读取已有的数据计算摘要(只读取续传的部分)，校验失败的块重新下载。
+服务器返回的Content-Range和Content-Length必须与请求的范围一致
+
+内容存储: 传入content_store和content_id时，先在存储中查找同一个流，命中时直接链接到保存路径，
+不发出任何请求；下载完成的流登记到存储
+"""
+import errno
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cache_manager import cache_manager
+from cdn_selector import CdnSelector, host_of
+from config import MAX_RETRIES, get_config_value
+from content_store import ContentStore
+from error_handler import HTTPStatusError
+from http_session import get_session
+from logger import logger
+from stream_integrity import BLOCK_SIZE, BlockHasher, IntegrityError, align_up, summarize
+
+# 可以继续拆分的最小分段大小
+MIN_SEGMENT_SIZE = 1024 * 1024
+
+# 未完成文件和进度记录的后缀
+PART_SUFFIX = ".part"
+PROGRESS_SUFFIX = ".part.json"
+
+# 进度记录的保存间隔（秒）
+SAVE_INTERVAL = 1.0
+
+# 单个连接低于该速度（字节/秒）时切换CDN节点
+MIN_HOST_SPEED = 32 * 1024
+
+# 吞吐量的测量窗口（秒）
+SPEED_WINDOW = 3.0
+
+# 下载策略: 单连接 / 分段并行
+STRATEGY_SINGLE = "single"
+STRATEGY_SEGMENTED = "segmented"
+
+# 小于该大小的流使用单连接下载
+SEGMENTED_MIN_SIZE = 16 * 1024 * 1024
+
+def select_strategy(content_length: Optional[int], min_size: Optional[int] = None) -> str:
+    """
+    按流的大小选择下载策略
+
+    Args:
+        content_length: 流的大小，未知时为None或0
+        min_size: 使用分段并行下载的最小大小，默认读取配置segmented_min_size
+
+    Returns:
+        str: STRATEGY_SINGLE或STRATEGY_SEGMENTED，大小未知时为STRATEGY_SEGMENTED
+    """
+    if min_size is None:
+        min_size = get_config_value("segmented_min_size", SEGMENTED_MIN_SIZE)
+    if content_length and content_length < min_size:
+        return STRATEGY_SINGLE
+    return STRATEGY_SEGMENTED
+
+def digest_cache_key(etag: str, size: int) -> str:
+    """流摘要的缓存键，同一个流重新下载时用作参考摘要"""
+    return f"stream_digest:{etag}:{size}"
+
+class _SlowHostError(Exception):
+    """当前节点吞吐量过低"""
+    pass
+
+def merge_ranges(ranges: List[List[int]]) -> List[List[int]]:
+    """合并重叠或相邻的字节范围"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+class Segment:
+    """字节范围 [start, end) 中尚未下载的部分为 [pos, end)"""
+
+    __slots__ = ("start", "end", "pos", "active")
+
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.end = end
+        self.pos = start
+        self.active = False  # 是否有线程正在下载
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.end - self.pos)
+
+    def __repr__(self):
+        return f"Segment({self.start}-{self.end}, pos={self.pos})"
+
+class StreamDownloader:
+    """分段下载器"""
+
+    def __init__(self, thread_count: Optional[int] = None, chunk_size: Optional[int] = None,
+                 session=None, bandwidth_limiter=None, consumer_id: Optional[str] = None,
+                 cancellation_event=None, min_segment_size: int = MIN_SEGMENT_SIZE,
+                 headers: Optional[Dict] = None, resume: bool = True,
+                 selector: Optional[CdnSelector] = None, min_speed: int = MIN_HOST_SPEED,
+                 content_store: Optional[ContentStore] = None, strategy: Optional[str] = None):
+        """
+        初始化分段下载器
+
+        Args:
+            thread_count: 并行连接数，默认使用设置中的thread_count
+            chunk_size: 每次读取的字节数，默认使用设置中的chunk_size
+            session: HTTP会话，默认使用全局共享会话
+            bandwidth_limiter: 带宽限制器，为None时不限速
+            consumer_id: 在带宽限制器中的消费者ID，通常为任务ID
+            cancellation_event: 取消事件，设置后尽快停止下载
+            min_segment_size: 工作窃取时拆分后每段的最小大小
+            headers: 额外的请求头
+            resume: 是否从已有的.part文件续传
+            selector: CDN节点选择器，默认使用全局评分表
+            min_speed: 单个连接的最低速度（字节/秒），持续低于该速度时切换节点，0表示不切换
+            content_store: 已下载流的存储，下载时传入content_id才会使用
+            strategy: 固定使用的下载策略，None表示按流的大小选择
+        """
+        self.thread_count = max(1, int(thread_count or get_config_value("thread_count", 8)))
+        self.chunk_size = int(chunk_size or get_config_value("chunk_size", 1024 * 1024))
+        self.session = session or get_session()
+        self.bandwidth_limiter = bandwidth_limiter
+        self.consumer_id = consumer_id
+        self.cancellation_event = cancellation_event
+        self.min_segment_size = max(1, min_segment_size)
+        self.headers = headers or {}
+        self.resume = resume
+        self.selector = selector or CdnSelector()
+        self.min_speed = min_speed
+        self.content_store = content_store
+        self.strategy = strategy
+        self.timeout = 15
+
+        self.lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._segments: List[Segment] = []
+        self._unclaimed = deque()
+        self._downloaded = 0
+        self._progress_callback: Optional[Callable[[int], None]] = None
+
+        # 供流式合并读取: 总大小、未完成文件路径、是否为单连接顺序下载
+        self.total_size = 0
+        self.part_path = None
+        self._sequential = False
+        self._connections = self.thread_count  # 本次下载使用的连接数
+
+        # 完整性校验: 下载完成后digest为流的摘要(不含各块摘要)
+        self.block_size = BLOCK_SIZE
+        self.digest: Optional[Dict] = None
+        self._hasher: Optional[BlockHasher] = None
+
+        # 候选CDN地址，_url_index为当前使用的节点
+        self._candidates: List[str] = []
+        self._url_index = 0
+
+        # 断点续传状态
+        self._fd = None  # .part文件的描述符
+        self._progress_path = None
+        self._total = 0
+        self._etag = None
+        self._done_before: List[List[int]] = []  # 本次下载开始前已完成的范围
+        self._save_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._last_save = 0.0
+
+    def stop(self):
+        """停止下载"""
+        self._stop_event.set()
+
+    def _check_stopped(self):
+        """已停止或已取消时抛出异常"""
+        if self._stop_event.is_set() or (self.cancellation_event is not None and self.cancellation_event.is_set()):
+            raise Exception("下载已取消")
+
+    def _fetch_stored(self, content_id: Optional[Tuple], path: str, total: int, etag: Optional[str]) -> Optional[int]:
+        """
+        从内容存储中取出同一个流
+
+        同一画质的AVC、HEVC和AV1流的cid和流ID可能相同，按探测到的大小和ETag匹配，
+        两者都未知时不使用存储
+
+        Returns:
+            Optional[int]: 命中时为文件大小，否则为None
+        """
+        if self.content_store is None or content_id is None or not (total or etag):
+            return None
+        entry = self.content_store.fetch(*content_id, path, size=total or None, etag=etag)
+        if entry is None:
+            return None
+        size = entry["size"]
+        self.digest = entry.get("digest")
+        self.total_size = size
+        self._sequential = True
+        self._downloaded = size
+        if self._progress_callback:
+            self._progress_callback(size)
+        return size
+
+    def probe(self, url: str):
+        """
+        探测流的总大小和是否支持范围请求
+
+        Args:
+            url: 流地址
+
+        Returns:
+            Tuple[int, bool, Optional[str]]: (总大小，未知时为0, 是否支持范围请求, ETag)
+        """
+        headers = dict(self.headers, Range="bytes=0-0")
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            etag = response.headers.get("ETag")
+            if response.status_code == 206:
+                # Content-Range: bytes 0-0/总大小
+                total = response.headers.get("Content-Range", "").rpartition("/")[2]
+                return (int(total) if total.isdigit() else 0), True, etag
+            return int(response.headers.get("Content-Length") or 0), False, etag
+
+    def download(self, url: str, path: str, progress_callback: Optional[Callable[[int], None]] = None,
+                 backup_urls: Optional[List[str]] = None, content_id: Optional[Tuple] = None,
+                 expected_digest: Optional[Dict] = None, size_hint: Optional[int] = None) -> int:
+        """
+        下载流到文件
+
+        Args:
+            url: 流地址(playurl中的base_url)
+            path: 保存路径
+            progress_callback: 进度回调，参数为已下载的总字节数
+            backup_urls: 其他CDN节点上的同一个流(playurl中的backup_url)
+            content_id: (cid, 流ID)，设置了content_store时，探测到的大小和ETag与存储中的条目一致才直接使用，
+                下载完成后登记到存储
+            expected_digest: 参考摘要(stream_integrity.BlockHasher.manifest()的结果)，
+                默认使用同一个流之前下载时记录的摘要
+            size_hint: 已知的流大小，小流只按已有评分选择CDN节点，不发出探测请求
+
+        Returns:
+            int: 文件大小
+        """
+        self._stop_event.clear()
+        self._downloaded = 0
+        self._progress_callback = progress_callback
+        self._segments = []
+        self._done_before = []
+        self._hasher = None
+        self.digest = None
+        part_path = path + PART_SUFFIX
+        progress_path = path + PROGRESS_SUFFIX
+        self.part_path = part_path
+
+        if backup_urls and (self.strategy or select_strategy(size_hint)) == STRATEGY_SINGLE:
+            # 探测所有节点的开销与下载小流本身相当
+            self._candidates = self.selector.scores.rank([url] + list(backup_urls))
+        elif backup_urls:
+            self._candidates = self.selector.select([url] + list(backup_urls), session=self.session,
+                                                    headers=self.headers)
+        else:
+            self._candidates = [url]
+        self._url_index = 0
+
+        total, ranged, etag = self._probe_candidates()
+        stored = self._fetch_stored(content_id, path, total, etag)
+        if stored is not None:
+            return stored
+        url = self._current_url()
+        self.total_size = total
+        self._sequential = not ranged or not total
+        if expected_digest is None and etag and total:
+            expected_digest = cache_manager.get(digest_cache_key(etag, total))
+        self._hasher = BlockHasher(total, self.block_size, expected_digest)
+        if self._sequential:
+            # 服务器不支持范围请求，无法续传
+            logger.debug(f"单连接下载: {url[:80]} ({total}字节)")
+            self._remove(progress_path)
+            try:
+                self._download_single(url, part_path)
+            except IntegrityError:
+                self._drop_reference(etag, total)
+                raise
+            if total and self._downloaded != total:
+                raise Exception(f"下载不完整: {self._downloaded}/{total}字节")
+            self._hasher.finish(self._downloaded)
+            os.replace(part_path, path)
+            self._finish_digest(etag)
+            self._store(content_id, path, etag)
+            return self._downloaded
+
+        self._progress_path = progress_path
+        self._total = total
+        self._etag = etag
+        done_before = self._load_progress(part_path, total, etag) if self.resume else []
+        self._fd = self._open_part(part_path, total, truncate=not done_before)
+        try:
+            self._done_before = self._verify_existing(done_before)
+        except Exception:
+            os.close(self._fd)
+            self._fd = None
+            raise
+        strategy = self.strategy or select_strategy(total)
+        self._connections = 1 if strategy == STRATEGY_SINGLE else self.thread_count
+        gaps = self._gaps(total, self._done_before)
+        self._segments = self._plan(gaps)
+        self._unclaimed = deque(self._segments)
+        self._downloaded = total - sum(end - start for start, end in gaps)
+        if self._downloaded:
+            logger.info(f"断点续传: {os.path.basename(path)} 已完成{self._downloaded}/{total}字节")
+        logger.debug(f"{'单连接' if strategy == STRATEGY_SINGLE else '分段'}下载: {url[:80]} "
+                     f"({total}字节, {len(self._segments)}段)")
+
+        errors = []
+        try:
+            workers = min(self._connections, len(self._segments))
+            if workers:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = [executor.submit(self._worker) for _ in range(workers)]
+                    for future in futures:
+                        try:
+                            future.result()
+                        except Exception as e:
+                            errors.append(e)
+                            # 一个线程失败后停止其他线程
+                            self._stop_event.set()
+        finally:
+            # 无论成功、失败还是取消，都记录已完成的范围
+            self._save_progress()
+            os.close(self._fd)
+            self._fd = None
+        if errors:
+            if isinstance(errors[0], IntegrityError):
+                self._drop_reference(etag, total)
+            raise errors[0]
+
+        missing = sum(segment.remaining for segment in self._segments)
+        if missing:
+            raise Exception(f"分段下载不完整，缺少{missing}字节")
+        unhashed = self._hasher.missing_blocks()
+        if unhashed:
+            raise Exception(f"分段下载不完整，{len(unhashed)}个块没有校验")
+
+        os.replace(part_path, path)
+        self._remove(progress_path)
+        self.selector.scores.save(force=True)
+        self._finish_digest(etag)
+        self._store(content_id, path, etag)
+        return total
+
+    def _finish_digest(self, etag: Optional[str]):
+        """生成流的摘要，记录为同一个流以后下载时的参考摘要"""
+        manifest = self._hasher.manifest()
+        self.digest = summarize(manifest)
+        if etag and manifest["size"]:
+            cache_manager.set(digest_cache_key(etag, manifest["size"]), manifest)
+
+    @staticmethod
+    def _drop_reference(etag: Optional[str], total: int):
+        """
+        重试后仍校验失败时丢弃参考摘要: 可能是参考摘要本身有误(例如远程文件变化但ETag未变)，
+        任务重试时不再比较，重新记录摘要
+        """
+        if etag and total:
+            cache_manager.clear(digest_cache_key(etag, total))
+
+    def _store(self, content_id: Optional[Tuple], path: str, etag: Optional[str]):
+        """把下载完成的流登记到内容存储"""
+        if self.content_store is not None and content_id is not None:
+            self.content_store.add(*content_id, path, etag=etag, digest=self.digest)
+
+    def _verify_existing(self, done: List[List[int]]) -> List[List[int]]:
+        """
+        续传前检查已下载的范围: 完整的块读取计算摘要，与参考摘要不一致的块重新下载；
+        范围末尾不完整的块读取已有部分作为摘要的中间状态，从范围末尾继续下载
+
+        Args:
+            done: 进度记录中已完成的范围
+
+        Returns:
+            List[List[int]]: 保留的范围，起点都对齐到块边界
+        """
+        kept = []
+        discarded = 0
+        for start, end in done:
+            first = align_up(start, self.block_size) // self.block_size
+            last = self._hasher.block_count if end == self._total else end // self.block_size
+            for index in range(first, last):
+                if self._hasher.hash_existing(index, self._read_at):
+                    kept.append(list(self._hasher.block_range(index)))
+                else:
+                    discarded += 1
+            tail = last * self.block_size
+            if last >= first and tail < end and self._hasher.seed(last, end, self._read_at):
+                kept.append([tail, end])
+        if discarded:
+            logger.warning(f"已下载的数据中有{discarded}个块校验失败，重新下载")
+        return merge_ranges(kept)
+
+    def contiguous_bytes(self) -> int:
+        """从文件开头起连续写入的字节数，流式合并时只读取这一部分"""
+        with self.lock:
+            if self._sequential:
+                available = self._downloaded
+            else:
+                done = merge_ranges(self._done_before + [[segment.start, segment.pos]
+                                                         for segment in self._segments if segment.pos > segment.start])
+                available = done[0][1] if done and done[0][0] == 0 else 0
+        hasher = self._hasher
+        if hasher is not None and hasher.expected is not None and available < self.total_size:
+            # 有参考摘要时块可能校验失败后重新下载，只提供已通过校验的完整块
+            available -= available % self.block_size
+        return available
+
+    def _current_url(self) -> str:
+        """当前使用的CDN地址"""
+        return self._candidates[self._url_index]
+
+    def _switch_host(self, failed_url: str, reason: str) -> bool:
+        """
+        当前节点失败或过慢时切换到下一个候选节点
+
+        Args:
+            failed_url: 出问题的地址，其他线程已经切换过时不再重复切换
+            reason: 切换原因，用于日志
+
+        Returns:
+            bool: 是否有其他节点可用
+        """
+        if len(self._candidates) <= 1:
+            return False
+        with self.lock:
+            switched = self._current_url() == failed_url
+            if switched:
+                self._url_index = (self._url_index + 1) % len(self._candidates)
+                logger.info(f"CDN节点{host_of(failed_url)}{reason}，切换到{host_of(self._current_url())}")
+        if switched:
+            self.selector.scores.record_failure(host_of(failed_url))
+        return True
+
+    def _probe_candidates(self):
+        """依次探测候选节点，直到有一个可用"""
+        for _ in range(len(self._candidates)):
+            url = self._current_url()
+            try:
+                return self.probe(url)
+            except Exception as e:
+                self._check_stopped()
+                if not self._switch_host(url, f"不可用({str(e)[:80]})") or url == self._candidates[-1]:
+                    raise
+        raise Exception("没有可用的CDN节点")
+
+    @staticmethod
+    def _open_part(path: str, total: int, truncate: bool) -> int:
+        """
+        打开.part文件并预分配到总大小
+
+        Args:
+            path: 文件路径
+            total: 总大小
+            truncate: 是否丢弃已有内容
+
+        Returns:
+            int: 文件描述符
+        """
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+        if truncate:
+            flags |= os.O_TRUNC
+        fd = os.open(path, flags, 0o644)
+        try:
+            if hasattr(os, 'posix_fallocate'):
+                try:
+                    # 一次性分配磁盘空间，减少碎片，磁盘空间不足时立即失败
+                    os.posix_fallocate(fd, 0, total)
+                    return fd
+                except OSError as e:
+                    # 部分文件系统不支持，退化为稀疏文件
+                    if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL, errno.ENOSYS):
+                        raise
+            if os.fstat(fd).st_size != total:
+                os.ftruncate(fd, total)
+            return fd
+        except Exception:
+            os.close(fd)
+            raise
+
+    def _read_at(self, size: int, offset: int) -> bytes:
+        """读取.part文件指定偏移的数据"""
+        if hasattr(os, 'pread'):
+            return os.pread(self._fd, size, offset)
+        with self._write_lock:
+            os.lseek(self._fd, offset, os.SEEK_SET)
+            return os.read(self._fd, size)
+
+    def _write_at(self, offset: int, data) -> None:
+        """把数据写入.part文件的指定偏移"""
+        view = memoryview(data)
+        if hasattr(os, 'pwrite'):
+            # 各分段的写入范围互不重叠，pwrite不改变文件位置，不需要加锁
+            while view:
+                written = os.pwrite(self._fd, view, offset)
+                view = view[written:]
+                offset += written
+            return
+        with self._write_lock:
+            os.lseek(self._fd, offset, os.SEEK_SET)
+            while view:
+                written = os.write(self._fd, view)
+                view = view[written:]
+
+    @staticmethod
+    def _gaps(total: int, done: List[List[int]]) -> List[List[int]]:
+        """已完成范围之外的缺口"""
+        gaps = []
+        pos = 0
+        for start, end in done:
+            if start > pos:
+                gaps.append([pos, start])
+            pos = max(pos, end)
+        if pos < total:
+            gaps.append([pos, total])
+        return gaps
+
+    def _plan(self, gaps: List[List[int]]) -> List[Segment]:
+        """把缺口按线程数平均拆分为分段，分段之间的边界对齐到块边界"""
+        missing = sum(end - start for start, end in gaps)
+        size = max(self.min_segment_size, -(-missing // self._connections))
+        segments = []
+        for start, end in gaps:
+            while start < end:
+                stop = min(end, align_up(start + size, self.block_size))
+                segments.append(Segment(start, stop))
+                start = stop
+        return segments
+
+    def _load_progress(self, part_path: str, total: int, etag: Optional[str]) -> List[List[int]]:
+        """
+        读取进度记录，ETag、总大小或.part文件与记录不一致时丢弃
+
+        Returns:
+            List[List[int]]: 已完成的字节范围
+        """
+        try:
+            with open(self._progress_path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            if record.get("size") != total or record.get("etag") != etag:
+                logger.info("远程文件已变化，重新下载")
+                return []
+            if os.path.getsize(part_path) != total:
+                return []
+            return merge_ranges([[int(start), int(end)] for start, end in record.get("done", [])
+                                 if 0 <= int(start) < int(end) <= total])
+        except (OSError, ValueError, TypeError, AttributeError):
+            return []
+
+    def _save_progress(self):
+        """把已完成的范围写入进度记录，分段的pos只在数据写入后前进，记录中的范围都已写入文件"""
+        if self._progress_path is None:
+            return
+        with self._save_lock:
+            with self.lock:
+                done = merge_ranges(self._done_before + [[segment.start, segment.pos]
+                                                         for segment in self._segments if segment.pos > segment.start])
+                self._last_save = time.monotonic()
+            record = {"size": self._total, "etag": self._etag, "done": done}
+            temp_path = self._progress_path + ".tmp"
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(record, f)
+                os.replace(temp_path, self._progress_path)
+            except OSError as e:
+                logger.warning(f"保存下载进度失败: {str(e)}")
+
+    @staticmethod
+    def _remove(path: str):
+        """删除文件，不存在时忽略"""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _claim(self) -> Optional[Segment]:
+        """领取一个分段，没有未领取的分段时从剩余最多的分段中窃取后半部分"""
+        with self.lock:
+            while self._unclaimed:
+                segment = self._unclaimed.popleft()
+                if segment.remaining:
+                    segment.active = True
+                    return segment
+
+            victim = max(self._segments, key=lambda s: s.remaining if s.active else 0, default=None)
+            # 原线程可能正在写入pos之后最多一个读取块的数据，拆分点必须在其之后
+            if victim is None or victim.remaining < 2 * max(self.min_segment_size, self.chunk_size):
+                return None
+            # 拆分点对齐到块边界，每块只由一个线程顺序写入
+            middle = align_up(victim.pos + victim.remaining // 2, self.block_size)
+            if middle >= victim.end:
+                return None
+            stolen = Segment(middle, victim.end)
+            stolen.active = True
+            victim.end = middle
+            self._segments.append(stolen)
+            return stolen
+
+    def _worker(self):
+        """下载线程: 不断领取分段直到没有可下载的部分"""
+        while True:
+            self._check_stopped()
+            segment = self._claim()
+            if segment is None:
+                return
+            try:
+                self._fetch_segment(segment)
+            finally:
+                with self.lock:
+                    segment.active = False
+
+    def _fetch_segment(self, segment: Segment):
+        """下载一个分段，连接中断时从断点重试，节点失败或过慢时换节点继续"""
+        attempt = 0
+        slow_switches = 0
+        while segment.remaining:
+            url = self._current_url()
+            try:
+                # 所有节点都慢时不再切换，避免来回跳转
+                self._fetch_range(url, segment, check_speed=slow_switches < len(self._candidates) - 1)
+            except _SlowHostError:
+                slow_switches += 1
+                self._switch_host(url, "速度过低")
+            except Exception as e:
+                self._check_stopped()
+                attempt += 1
+                if attempt > MAX_RETRIES:
+                    raise
+                self._switch_host(url, f"请求失败({str(e)[:80]})")
+                logger.debug(f"分段{segment}下载中断，第{attempt}次重试: {str(e)}")
+
+    def _fetch_range(self, url: str, segment: Segment, check_speed: bool = True):
+        """请求分段剩余部分的字节范围并写入文件，记录节点的延迟和吞吐量"""
+        request_start, request_end = segment.pos, segment.end
+        headers = dict(self.headers, Range=f"bytes={request_start}-{request_end - 1}")
+        started = time.monotonic()
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise HTTPStatusError(f"服务器未按范围返回数据: HTTP {response.status_code}", response.status_code)
+            self._check_range(response, request_start, request_end)
+            latency = time.monotonic() - started
+            received = 0
+            window_start = time.monotonic()
+            window_bytes = 0
+
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                self._check_stopped()
+                if not chunk:
+                    continue
+                with self.lock:
+                    # 分段可能已被窃取缩短，超出新结束位置的数据丢弃
+                    offset = segment.pos
+                    size = min(len(chunk), max(0, segment.end - offset))
+                if size:
+                    data = memoryview(chunk)[:size]
+                    self._write_at(offset, data)
+                    try:
+                        # 块写完时与参考摘要比较，分段的pos在比较之后才前进
+                        self._hasher.update(offset, data)
+                    except IntegrityError as e:
+                        self._rewind(segment, e)
+                        raise
+                with self.lock:
+                    segment.pos += size
+                    self._downloaded += size
+                    downloaded = self._downloaded
+                    done = segment.remaining == 0
+                    save = time.monotonic() - self._last_save >= SAVE_INTERVAL
+                if save:
+                    self._save_progress()
+                if size:
+                    self._on_bytes(size, downloaded)
+                received += size
+                if done:
+                    break
+
+                # 按窗口测量本连接的吞吐量(包含限速等待，限速时不判断)
+                window_bytes += size
+                elapsed = time.monotonic() - window_start
+                if elapsed >= SPEED_WINDOW:
+                    if (check_speed and self.min_speed and window_bytes / elapsed < self.min_speed
+                            and not (self.bandwidth_limiter and self.bandwidth_limiter.rate)):
+                        raise _SlowHostError()
+                    window_start = time.monotonic()
+                    window_bytes = 0
+
+        elapsed = time.monotonic() - started - latency
+        if received and elapsed > 0:
+            self.selector.scores.record(host_of(url), latency=latency, speed=received / elapsed)
+
+        if segment.remaining:
+            raise Exception("连接在分段结束前关闭")
+
+    def _check_range(self, response, start: int, end: int):
+        """检查响应的Content-Range和Content-Length与请求的范围一致"""
+        match = re.match(r'bytes (\d+)-(\d+)/(\d+|\*)', response.headers.get("Content-Range", ""))
+        if match is None:
+            raise Exception(f"服务器返回的Content-Range无效: {response.headers.get('Content-Range')}")
+        first, last, total = match.groups()
+        if int(first) != start or int(last) != end - 1 or (total != "*" and int(total) != self._total):
+            raise Exception(f"服务器返回的范围与请求不一致: {match.group(0)}，请求{start}-{end - 1}/{self._total}")
+        length = response.headers.get("Content-Length")
+        if length is not None and int(length) != end - start:
+            raise Exception(f"服务器返回的长度与请求不一致: {length}，请求{end - start}字节")
+
+    def _rewind(self, segment: Segment, error: IntegrityError):
+        """块校验失败，分段退回到该块起点，重新下载该块"""
+        block_start, block_end = self._hasher.block_range(error.block)
+        with self.lock:
+            self._downloaded += block_start - segment.pos
+            # 续传的数据可能占据该块的前一部分，也需要重新下载
+            segment.start = min(segment.start, block_start)
+            segment.pos = block_start
+            self._done_before = [part for start, end in self._done_before
+                                 for part in ([start, min(end, block_start)], [max(start, block_end), end])
+                                 if part[0] < part[1]]
+        self._hasher.reset(error.block)
+        logger.warning(f"{str(error)}，重新下载")
+
+    def _download_single(self, url: str, path: str) -> int:
+        """单连接顺序下载"""
+        with self.session.get(url, headers=self.headers, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            # 不使用缓冲，已计数的字节都已写入文件，流式合并可以立即读取
+            with open(path, 'wb', buffering=0) as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    self._check_stopped()
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    self._hasher.update(self._downloaded, chunk)
+                    self._downloaded += len(chunk)
+                    self._on_bytes(len(chunk), self._downloaded)
+        return self._downloaded
+
+    def _on_bytes(self, nbytes: int, downloaded: int):
+        """限速并报告进度"""
+        if self.bandwidth_limiter is not None and self.consumer_id is not None:
+            self.bandwidth_limiter.consume(self.consumer_id, nbytes, cancel_event=self.cancellation_event)
+        if self._progress_callback:
+            self._progress_callback(downloaded)
@@ -0,0 +1,209 @@
+"""
+下载过程中的流完整性校验
+
+数据写入文件的同时计算摘要，下载完成后不需要重新读取整个文件:
+- 流按固定大小(BLOCK_SIZE)划分为块，每块单独计算SHA-256；分段下载的分段边界和工作窃取的
+  拆分点都对齐到块边界，每块只由一个线程按顺序写入，摘要与分段方式和线程数无关
+- 所有块的摘要组合为Merkle树的根摘要，作为整个流的摘要
+- 有参考摘要(同一个流之前下载的结果)时，每块写完立即比较，不一致的块重新下载
+"""
+import hashlib
+import threading
+from typing import Callable, Dict, List, Optional
+
+# 块大小
+BLOCK_SIZE = 1024 * 1024
+
+ALGORITHM = "sha256"
+
+class IntegrityError(Exception):
+    """块的摘要与参考摘要不一致"""
+
+    def __init__(self, block: int, start: int):
+        super().__init__(f"数据校验失败: 第{block}块(偏移{start})与参考摘要不一致")
+        self.block = block
+        self.start = start
+
+def merkle_root(digests: List[str]) -> str:
+    """
+    计算块摘要组成的Merkle树的根摘要，奇数个节点时最后一个直接进入上一层
+
+    Args:
+        digests: 按顺序排列的块摘要(十六进制)
+
+    Returns:
+        str: 根摘要(十六进制)
+    """
+    level = [bytes.fromhex(digest) for digest in digests]
+    if not level:
+        return hashlib.new(ALGORITHM).hexdigest()
+    while len(level) > 1:
+        level = [hashlib.new(ALGORITHM, level[i] + level[i + 1]).digest() if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+    return level[0].hex()
+
+def align_up(offset: int, block_size: int = BLOCK_SIZE) -> int:
+    """向上对齐到块边界"""
+    return -(-offset // block_size) * block_size
+
+class BlockHasher:
+    """按块计算流的摘要"""
+
+    def __init__(self, total: int = 0, block_size: int = BLOCK_SIZE, expected: Optional[Dict] = None):
+        """
+        初始化
+
+        Args:
+            total: 流的总大小，0表示未知(只能顺序写入)
+            block_size: 块大小
+            expected: 参考摘要(manifest()的结果)，块大小或总大小不一致时忽略
+        """
+        self.total = total
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        # 块序号 -> [hash对象, 下一个应写入的偏移]
+        self._states: Dict[int, list] = {}
+        self._digests: Dict[int, str] = {}
+        self.expected: Optional[List[str]] = None
+        if (expected and expected.get("algorithm") == ALGORITHM and expected.get("block_size") == block_size
+                and expected.get("size") == total and expected.get("blocks")):
+            self.expected = list(expected["blocks"])
+
+    @property
+    def block_count(self) -> int:
+        return -(-self.total // self.block_size)
+
+    def block_range(self, index: int):
+        """块的字节范围 [start, end)"""
+        start = index * self.block_size
+        end = start + self.block_size
+        return start, min(end, self.total) if self.total else end
+
+    def update(self, offset: int, data) -> None:
+        """
+        计入在offset处写入的数据，每块必须从块起点开始按顺序写入
+
+        Raises:
+            IntegrityError: 有块写完后与参考摘要不一致，该块的状态已清除
+        """
+        view = memoryview(data)
+        while view:
+            index = offset // self.block_size
+            start, end = self.block_range(index)
+            size = min(len(view), end - offset)
+            with self.lock:
+                state = self._states.get(index)
+                if state is None:
+                    if offset != start:
+                        raise ValueError(f"第{index}块没有从块起点写入: {offset}")
+                    state = self._states[index] = [hashlib.new(ALGORITHM), start]
+                elif state[1] != offset:
+                    raise ValueError(f"第{index}块写入位置不连续: {offset}")
+            state[0].update(view[:size])
+            state[1] += size
+            if state[1] == end:
+                self._finish_block(index, state[0].hexdigest())
+            view = view[size:]
+            offset += size
+
+    def _finish_block(self, index: int, digest: str):
+        with self.lock:
+            self._states.pop(index, None)
+            if self.expected is not None and index < len(self.expected) and self.expected[index] != digest:
+                raise IntegrityError(index, index * self.block_size)
+            self._digests[index] = digest
+
+    def finish(self, total: int) -> None:
+        """总大小未知的流下载结束后调用，计算最后一个不完整块的摘要"""
+        self.total = total
+        with self.lock:
+            pending = list(self._states.items())
+        for index, state in pending:
+            if state[1] == self.block_range(index)[1]:
+                self._finish_block(index, state[0].hexdigest())
+
+    def reset(self, index: int):
+        """丢弃块的状态和摘要，重新下载该块时调用"""
+        with self.lock:
+            self._states.pop(index, None)
+            self._digests.pop(index, None)
+
+    def _hash_file(self, start: int, end: int, read: Callable[[int, int], bytes]):
+        """读取文件中 [start, end) 的数据计算摘要，数据不完整时返回None"""
+        hasher = hashlib.new(ALGORITHM)
+        offset = start
+        while offset < end:
+            data = read(min(1024 * 1024, end - offset), offset)
+            if not data:
+                return None
+            hasher.update(data)
+            offset += len(data)
+        return hasher
+
+    def hash_existing(self, index: int, read: Callable[[int, int], bytes]) -> bool:
+        """
+        计算已在文件中的块(续传前下载的部分)的摘要
+
+        Args:
+            index: 块序号
+            read: 读取函数，参数为(长度, 偏移)
+
+        Returns:
+            bool: 是否与参考摘要一致(没有参考摘要时总是True)
+        """
+        hasher = self._hash_file(*self.block_range(index), read)
+        if hasher is None:
+            return False
+        try:
+            self._finish_block(index, hasher.hexdigest())
+            return True
+        except IntegrityError:
+            return False
+
+    def seed(self, index: int, end: int, read: Callable[[int, int], bytes]) -> bool:
+        """
+        块的前一部分已在文件中时，读取这部分计算摘要的中间状态，之后从end继续写入
+
+        Args:
+            index: 块序号
+            end: 已有部分的结束偏移
+            read: 读取函数，参数为(长度, 偏移)
+
+        Returns:
+            bool: 是否读取成功
+        """
+        start = self.block_range(index)[0]
+        hasher = self._hash_file(start, end, read)
+        if hasher is None:
+            return False
+        with self.lock:
+            self._states[index] = [hasher, end]
+        return True
+
+    def missing_blocks(self) -> List[int]:
+        """尚未得到摘要的块"""
+        with self.lock:
+            return [index for index in range(self.block_count) if index not in self._digests]
+
+    def manifest(self) -> Dict:
+        """
+        导出摘要，所有块都已完成时调用
+
+        Returns:
+            Dict: algorithm、block_size、size、root、blocks(各块摘要)和verified(是否与参考摘要比较过)
+        """
+        blocks = [self._digests[index] for index in range(self.block_count)]
+        return {
+            "algorithm": ALGORITHM,
+            "block_size": self.block_size,
+            "size": self.total,
+            "root": merkle_root(blocks),
+            "blocks": blocks,
+            "verified": self.expected is not None
+        }
+
+def summarize(manifest: Optional[Dict]) -> Optional[Dict]:
+    """去掉各块摘要的简要信息，用于下载结果和历史记录"""
+    if not manifest:
+        return None
+    return {key: value for key, value in manifest.items() if key != "blocks"}
@@ -0,0 +1,313 @@
+"""
+音视频流并行下载和流式合并
+
+DASH视频流和音频流同时下载，合并与下载重叠进行，总耗时接近两者中较慢的一个:
+- 两个流各由一个分段下载器在独立线程中下载
+- 支持命名管道的平台(Linux/macOS)上，FFmpeg从两个命名管道读取输入，后台线程把每个流
+  从文件开头起已连续写入的部分送入管道，下载结束时合并也基本完成
+- Linux上已送入FFmpeg的部分立即从中间文件中释放磁盘空间(打孔)，中间文件不会占用与输出文件
+  相同的额外空间；合并失败时中间文件已不完整，会被删除，下次重新下载。
+  使用内容存储的流不释放，下载完成后登记到存储
+- 不支持命名管道的平台(Windows)上，两个流并行下载完成后再合并
+"""
+import ctypes
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from logger import logger
+from post_processor import merge_audio_video
+from segmented_downloader import PART_SUFFIX, PROGRESS_SUFFIX, StreamDownloader
+
+# 每次送入管道的字节数
+FEED_CHUNK = 1024 * 1024
+
+# 等待新数据的间隔（秒）
+POLL_INTERVAL = 0.1
+
+# fallocate打孔标志: FALLOC_FL_KEEP_SIZE | FALLOC_FL_PUNCH_HOLE
+_PUNCH_HOLE_FLAGS = 0x01 | 0x02
+
+def _load_fallocate():
+    """加载libc的fallocate，非Linux平台返回None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fallocate = libc.fallocate
+        fallocate.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong)
+        return fallocate
+    except (OSError, AttributeError):
+        return None
+
+_fallocate = _load_fallocate()
+
+class _StreamJob:
+    """一个流的下载状态"""
+
+    def __init__(self, name: str, downloader: StreamDownloader, source: Dict, progress_callback):
+        self.name = name
+        self.downloader = downloader
+        self.progress_callback = progress_callback
+        self.url = source["url"]
+        self.backup_urls = source.get("backup_urls")
+        self.path = source["path"]
+        self.content_id = source.get("content_id")
+        self.done = threading.Event()
+        self.error: Optional[Exception] = None
+        self.released = 0  # 已释放的字节数
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        try:
+            self.downloader.download(self.url, self.path, self.progress_callback, self.backup_urls, self.content_id)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+class StreamingMerger:
+    """音视频流并行下载和流式合并"""
+
+    def __init__(self, thread_count: Optional[int] = None, session=None, bandwidth_limiter=None,
+                 consumer_id: Optional[str] = None, cancellation_event=None, progress_callback=None,
+                 release_consumed: bool = True, content_store=None):
+        """
+        初始化合并器
+
+        Args:
+            thread_count: 每个流的并行连接数
+            session: HTTP会话
+            bandwidth_limiter: 带宽限制器，两个流共享同一个消费者
+            consumer_id: 在带宽限制器中的消费者ID
+            cancellation_event: 取消事件
+            progress_callback: 进度回调，参数为两个流已下载的总字节数
+            release_consumed: 是否释放已送入FFmpeg的中间文件空间(仅Linux)
+            content_store: 已下载流的存储，流带有content_id时使用
+        """
+        self.cancellation_event = cancellation_event
+        self.progress_callback = progress_callback
+        self.release_consumed = release_consumed and _fallocate is not None
+        self._downloaded: Dict[str, int] = {}
+        self._progress_lock = threading.Lock()
+        self._options = dict(thread_count=thread_count, session=session, bandwidth_limiter=bandwidth_limiter,
+                             consumer_id=consumer_id, cancellation_event=cancellation_event,
+                             content_store=content_store)
+        self.downloaders: List[StreamDownloader] = []
+
+    @property
+    def total_size(self) -> int:
+        """两个流的总大小，探测完成前为0"""
+        return sum(downloader.total_size for downloader in self.downloaders)
+
+    @property
+    def digests(self) -> Dict[str, Optional[Dict]]:
+        """各个流下载时计算的摘要，键为video和audio"""
+        return {name: downloader.digest for name, downloader in zip(("video", "audio"), self.downloaders)}
+
+    def stop(self):
+        """停止下载"""
+        for downloader in self.downloaders:
+            downloader.stop()
+
+    def run(self, video: Dict, audio: Dict, output_path: str) -> str:
+        """
+        下载并合并音视频流
+
+        Args:
+            video: 视频流，包含url、path(中间文件路径)，可选backup_urls和content_id
+            audio: 音频流，格式同video
+            output_path: 输出文件路径
+
+        Returns:
+            str: 输出文件路径
+        """
+        if shutil.which('ffmpeg') is None:
+            raise Exception("未找到FFmpeg，无法合并视频和音频")
+
+        jobs = [self._create_job("video", video), self._create_job("audio", audio)]
+        for job in jobs:
+            job.thread.start()
+
+        if hasattr(os, 'mkfifo'):
+            self._merge_streaming(jobs, output_path)
+        else:
+            self._wait_downloads(jobs)
+            merge_audio_video(jobs[0].path, jobs[1].path, output_path)
+
+        for job in jobs:
+            self._remove_intermediate(job)
+        return output_path
+
+    def _create_job(self, name: str, source: Dict) -> _StreamJob:
+        """创建一个流的下载器，进度按流分别累计后合并报告"""
+        downloader = StreamDownloader(**self._options)
+        self.downloaders.append(downloader)
+
+        def on_progress(downloaded: int):
+            with self._progress_lock:
+                self._downloaded[name] = downloaded
+                total = sum(self._downloaded.values())
+            if self.progress_callback:
+                self.progress_callback(total)
+
+        return _StreamJob(name, downloader, source, on_progress)
+
+    @staticmethod
+    def _wait_downloads(jobs: List[_StreamJob]):
+        """等待两个流下载完成，任一失败时停止另一个并抛出异常"""
+        for job in jobs:
+            job.done.wait()
+            if job.error is not None:
+                for other in jobs:
+                    other.downloader.stop()
+                for other in jobs:
+                    other.done.wait()
+                raise job.error
+
+    def _merge_streaming(self, jobs: List[_StreamJob], output_path: str):
+        """FFmpeg从命名管道读取两个流，与下载同时进行"""
+        fifo_dir = tempfile.mkdtemp(prefix="bili_merge_")
+        fifos = [os.path.join(fifo_dir, job.name) for job in jobs]
+        for fifo in fifos:
+            os.mkfifo(fifo)
+
+        command = ['ffmpeg', '-y', '-loglevel', 'error', '-i', fifos[0], '-i', fifos[1], '-c', 'copy', output_path]
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        feed_errors: List[Exception] = []
+        feeders = [threading.Thread(target=self._feed, args=(job, fifo, process, feed_errors), daemon=True)
+                   for job, fifo in zip(jobs, fifos)]
+        for feeder in feeders:
+            feeder.start()
+
+        try:
+            self._wait_downloads(jobs)
+        except Exception:
+            process.kill()
+            raise
+        finally:
+            for feeder in feeders:
+                feeder.join()
+            _, stderr = process.communicate()
+            shutil.rmtree(fifo_dir, ignore_errors=True)
+            if process.returncode != 0 or feed_errors:
+                # 打孔后中间文件已不完整，不能用于续传
+                for job in jobs:
+                    if job.released:
+                        self._remove_intermediate(job)
+
+        if process.returncode != 0:
+            message = stderr.decode('utf-8', errors='ignore').strip()[:300]
+            raise Exception(f"FFmpeg合并失败: {message or feed_errors}")
+        if feed_errors:
+            raise feed_errors[0]
+
+    def _feed(self, job: _StreamJob, fifo: str, process: subprocess.Popen, errors: List[Exception]):
+        """把流从开头起已连续写入的部分送入命名管道"""
+        out_fd = None
+        src_fd = None
+        pos = 0
+        try:
+            out_fd = self._open_fifo(fifo, process)
+            if out_fd is None:
+                return
+            while True:
+                available = job.downloader.contiguous_bytes()
+                if available > pos:
+                    if src_fd is None:
+                        src_fd = self._open_source(job)
+                    while pos < available:
+                        data = os.pread(src_fd, min(FEED_CHUNK, available - pos), pos)
+                        if not data:
+                            break
+                        self._write_all(out_fd, data)
+                        # 登记到内容存储的流与存储中的文件共享数据，不能释放
+                        if self.release_consumed and job.content_id is None:
+                            self._release(job, src_fd, pos, len(data))
+                        pos += len(data)
+                    continue
+                if job.done.is_set():
+                    # 下载失败时停止送数据，FFmpeg会被结束
+                    if job.error is not None or pos >= job.downloader.total_size:
+                        return
+                job.done.wait(POLL_INTERVAL)
+        except BrokenPipeError:
+            # FFmpeg提前退出，错误由返回码报告
+            pass
+        except Exception as e:
+            errors.append(e)
+            process.kill()
+        finally:
+            for fd in (out_fd, src_fd):
+                if fd is not None:
+                    os.close(fd)
+
+    def _open_fifo(self, fifo: str, process: subprocess.Popen) -> Optional[int]:
+        """等待FFmpeg打开管道的读端后打开写端，FFmpeg提前退出时返回None"""
+        while True:
+            try:
+                fd = os.open(fifo, os.O_WRONLY | os.O_NONBLOCK)
+                os.set_blocking(fd, True)
+                return fd
+            except OSError:
+                # 读端尚未打开(ENXIO)
+                if process.poll() is not None:
+                    return None
+                if self.cancellation_event is not None and self.cancellation_event.is_set():
+                    return None
+                time.sleep(POLL_INTERVAL)
+
+    @staticmethod
+    def _open_source(job: _StreamJob) -> int:
+        """打开流的中间文件，下载完成后.part文件已被重命名"""
+        flags = os.O_RDWR | getattr(os, 'O_BINARY', 0)
+        try:
+            return os.open(job.downloader.part_path, flags)
+        except FileNotFoundError:
+            return os.open(job.path, flags)
+
+    @staticmethod
+    def _write_all(fd: int, data: bytes):
+        """写入全部数据，管道满时write可能只写入一部分"""
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+
+    def _release(self, job: _StreamJob, fd: int, offset: int, length: int):
+        """释放已送入FFmpeg的数据占用的磁盘空间"""
+        if _fallocate(fd, _PUNCH_HOLE_FLAGS, offset, length) == 0:
+            job.released += length
+        else:
+            # 文件系统不支持打孔
+            self.release_consumed = False
+
+    @staticmethod
+    def _remove_intermediate(job: _StreamJob):
+        """删除中间文件和进度记录"""
+        for path in (job.path, job.path + PART_SUFFIX, job.path + PROGRESS_SUFFIX):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def download_and_merge(video: Dict, audio: Dict, output_path: str, **kwargs) -> str:
+    """
+    并行下载音视频流并合并为一个文件
+
+    Args:
+        video: 视频流，包含url、path(中间文件路径)，可选backup_urls和content_id
+        audio: 音频流，格式同video
+        output_path: 输出文件路径
+        **kwargs: 传给StreamingMerger的参数
+
+    Returns:
+        str: 输出文件路径
+    """
+    logger.debug(f"并行下载并合并: {output_path}")
+    return StreamingMerger(**kwargs).run(video, audio, output_path)
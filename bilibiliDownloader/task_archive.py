@@ -0,0 +1,138 @@
+"""
+任务归档，把已结束的任务移出内存并保存到磁盘，归档后仍可按任务ID查询
+
+归档文件为JSON Lines格式，每行一个任务；内存中只保留 任务ID -> 文件偏移 的索引，
+以及已完成任务的去重键摘要 -> 任务ID 的索引，用于归档后继续去重
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Iterator, Optional, Sequence
+
+from logger import logger
+
+def _key_digest(dedup_key: Sequence) -> bytes:
+    """去重键的8字节摘要，比保存完整的键占用更少内存，查找时再与归档记录中的键比较"""
+    return hashlib.blake2b(json.dumps(list(dedup_key), ensure_ascii=False).encode('utf-8'), digest_size=8).digest()
+
+class TaskArchive:
+    """任务归档"""
+
+    def __init__(self, path: str):
+        """
+        初始化任务归档，已有归档文件时重建索引
+
+        Args:
+            path: 归档文件路径
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self._index: Dict[str, int] = {}  # task_id -> 行首偏移
+        self._keys: Dict[bytes, str] = {}  # 已完成任务的去重键摘要 -> task_id
+        self._load_index()
+
+    def _load_index(self):
+        """扫描归档文件，重建索引"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                offset = 0
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self._index[record["task_id"]] = offset
+                        self._index_key(record)
+                    except (ValueError, KeyError):
+                        pass
+                    offset += len(line)
+        except Exception as e:
+            logger.error(f"读取任务归档失败: {str(e)}")
+
+    def add(self, record: Dict) -> bool:
+        """
+        归档一个任务
+
+        Args:
+            record: 任务信息，必须包含task_id
+
+        Returns:
+            bool: 是否成功归档
+        """
+        line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode('utf-8')
+        with self.lock:
+            try:
+                with open(self.path, 'ab') as f:
+                    offset = f.seek(0, os.SEEK_END)
+                    f.write(line)
+                self._index[record["task_id"]] = offset
+                self._index_key(record)
+                return True
+            except Exception as e:
+                logger.error(f"写入任务归档失败: {str(e)}")
+                return False
+
+    def _index_key(self, record: Dict):
+        """登记已完成任务的去重键"""
+        if record.get("status") == "completed" and record.get("dedup_key"):
+            self._keys[_key_digest(record["dedup_key"])] = record["task_id"]
+
+    def find_completed(self, dedup_key: Sequence) -> Optional[Dict]:
+        """
+        按去重键查找已完成的归档任务
+
+        Args:
+            dedup_key: 去重键
+
+        Returns:
+            Optional[Dict]: 任务信息，不存在时返回None
+        """
+        task_id = self._keys.get(_key_digest(dedup_key))
+        record = self.get(task_id) if task_id else None
+        if record is None or tuple(record.get("dedup_key") or ()) != tuple(dedup_key):
+            return None
+        return record
+
+    def get(self, task_id: str) -> Optional[Dict]:
+        """
+        查询已归档的任务
+
+        Args:
+            task_id: 任务ID
+
+        Returns:
+            Optional[Dict]: 任务信息，不存在时返回None
+        """
+        with self.lock:
+            offset = self._index.get(task_id)
+            if offset is None:
+                return None
+            try:
+                with open(self.path, 'rb') as f:
+                    f.seek(offset)
+                    return json.loads(f.readline())
+            except Exception as e:
+                logger.error(f"读取任务归档失败: {str(e)}")
+                return None
+
+    def __contains__(self, task_id: str) -> bool:
+        return task_id in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def iter_records(self) -> Iterator[Dict]:
+        """按归档顺序遍历所有任务，同一任务多次归档时只返回最后一次"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    if self._index.get(record["task_id"]) == offset:
+                        yield record
+                except (ValueError, KeyError):
+                    pass
+                offset += len(line)
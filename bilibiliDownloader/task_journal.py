@@ -0,0 +1,172 @@
+"""
+任务日志，以追加写的方式把任务状态变化记录到磁盘，使下载管理器在重启后可以恢复未完成的任务
+
+日志文件为JSON Lines格式，每行一条记录:
+- {"op": "task", "task_id": ..., "url": ..., ...}: 任务的完整信息(添加任务或修改任务属性时写入)
+- {"op": "status", "task_id": ..., "status": ...}: 任务状态变化
+
+已结束(完成/失败/取消)的任务在压缩时从日志中移除，压缩通过写临时文件再替换完成，中途崩溃不会损坏原日志
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, List
+
+from logger import logger
+
+# 已结束的任务状态，重启后不再恢复
+FINISHED_STATUSES = ("completed", "failed", "canceled")
+
+class TaskJournal:
+    """任务日志"""
+
+    def __init__(self, path: str, compact_threshold: int = 5000):
+        """
+        初始化任务日志
+
+        Args:
+            path: 日志文件路径
+            compact_threshold: 自上次压缩以来追加的记录数超过该值时自动压缩
+        """
+        self.path = path
+        self.compact_threshold = compact_threshold
+        self.lock = threading.Lock()
+        self._file = None
+        self._live = {}  # task_id -> 未结束任务的最新信息，压缩时写回
+        self._loaded = False  # 是否已重放，重放前_live不完整，不能压缩
+        self._appended = 0  # 自上次压缩以来追加的记录数
+
+    def replay(self) -> List[Dict]:
+        """
+        重放日志，得到所有未结束的任务
+
+        Returns:
+            List[Dict]: 按添加顺序排列的任务信息，包含最后记录的status
+        """
+        live = {}
+        existed = os.path.exists(self.path)
+        if existed:
+            loads = json.loads
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = loads(line)
+                        op = record.pop("op")
+                        task_id = record["task_id"]
+                    except (ValueError, KeyError):
+                        # 崩溃时可能留下写了一半的最后一行，直接跳过
+                        continue
+
+                    if op == "task":
+                        entry = live.get(task_id)
+                        if entry is None:
+                            if "url" not in record:
+                                # 只修改了部分属性的记录，任务已结束或完整信息已丢失
+                                continue
+                            record.setdefault("status", "pending")
+                            live[task_id] = record
+                        else:
+                            entry.update(record)
+                    elif op == "status":
+                        entry = live.get(task_id)
+                        if entry is None:
+                            continue
+                        if record["status"] in FINISHED_STATUSES:
+                            del live[task_id]
+                        else:
+                            entry["status"] = record["status"]
+
+        with self.lock:
+            # 重放前追加的记录已包含在文件中
+            self._live = live
+            self._loaded = True
+            if existed:
+                self._compact_locked()
+
+        return list(live.values())
+
+    def record_task(self, task_info: Dict):
+        """
+        记录任务的完整信息，或修改未结束任务的部分属性
+
+        Args:
+            task_info: 任务信息，必须包含task_id；只包含部分属性时，任务已结束(不在日志中)则忽略
+        """
+        record = dict(task_info, op="task")
+        with self.lock:
+            entry = self._live.get(task_info["task_id"])
+            if entry is None:
+                if "url" not in task_info:
+                    return
+                self._live[task_info["task_id"]] = dict(task_info)
+            else:
+                entry.update(task_info)
+            self._append_locked(record)
+
+    def record_status(self, task_id: str, status: str):
+        """
+        记录任务状态变化
+
+        Args:
+            task_id: 任务ID
+            status: 新状态
+        """
+        record = {"op": "status", "task_id": task_id, "status": status, "ts": time.time()}
+        with self.lock:
+            if status in FINISHED_STATUSES:
+                self._live.pop(task_id, None)
+            elif task_id in self._live:
+                self._live[task_id]["status"] = status
+            self._append_locked(record)
+
+    def compact(self):
+        """压缩日志，只保留未结束的任务"""
+        with self.lock:
+            self._compact_locked()
+
+    def close(self):
+        """压缩并关闭日志文件"""
+        with self.lock:
+            self._compact_locked()
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def _append_locked(self, record: Dict):
+        """追加一条记录，调用方必须持有lock"""
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self._appended += 1
+        except Exception as e:
+            logger.error(f"写入任务日志失败: {str(e)}")
+            return
+
+        if self._appended >= self.compact_threshold:
+            self._compact_locked()
+
+    def _compact_locked(self):
+        """重写日志文件，调用方必须持有lock"""
+        if not self._loaded:
+            # 没有重放过的日志只追加，不能用不完整的_live覆盖
+            return
+        temp_path = f"{self.path}.tmp"
+        try:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for entry in self._live.values():
+                    f.write(json.dumps(dict(entry, op="task"), ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(temp_path, self.path)
+            self._appended = 0
+            logger.debug(f"任务日志已压缩，保留{len(self._live)}个未完成任务")
+        except Exception as e:
+            logger.error(f"压缩任务日志失败: {str(e)}")
@@ -0,0 +1,213 @@
+"""
+任务性能指标，用于容量规划和定位瓶颈阶段
+
+单个任务记录各阶段的时间点和字节数:
+- 排队等待: 进入等待队列到被工作线程领取(重试的退避时间不计入)
+- 元数据解析: 被领取到下载器报告元数据(视频信息、播放地址)解析完成
+- 首字节: 被领取到收到第一个字节
+- 网络阶段的平均速度和峰值速度
+- 合并耗时和最终写入的字节数
+汇总指标在任务结束时累加，任务被归档后仍然保留
+"""
+import threading
+import time
+from typing import Dict, Optional
+
+# 峰值速度的采样窗口（秒）
+PEAK_WINDOW = 1.0
+
+# 参与汇总的指标，时间单位为秒，速度单位为字节/秒
+SUMMARY_METRICS = ("queue_wait", "metadata_latency", "ttfb", "network_time", "avg_speed",
+                   "peak_speed", "merge_time", "bytes_written", "retries")
+
+class TaskMetrics:
+    """单个任务的性能指标"""
+
+    __slots__ = (
+        "created_at", "enqueued_at", "queue_wait", "dispatched_at", "metadata_at", "first_byte_at",
+        "network_end_at", "merge_start_at", "merge_end_at", "bytes_received", "attempt_bytes",
+        "peak_speed", "bytes_written", "_window_start", "_window_bytes"
+    )
+
+    def __init__(self):
+        now = time.time()
+        self.created_at = now
+        self.enqueued_at = now  # 最近一次进入等待队列的时间
+        self.queue_wait = 0.0  # 累计排队等待时间（秒）
+        self.dispatched_at = None  # 最近一次被工作线程领取的时间
+        self.metadata_at = None
+        self.first_byte_at = None
+        self.network_end_at = None
+        self.merge_start_at = None
+        self.merge_end_at = None
+        self.bytes_received = 0  # 所有尝试累计收到的字节数
+        self.attempt_bytes = 0  # 本次尝试收到的字节数
+        self.peak_speed = 0.0  # 峰值速度（字节/秒）
+        self.bytes_written = 0  # 最终输出文件的大小
+        self._window_start = None
+        self._window_bytes = 0
+
+    def mark_enqueued(self, when: Optional[float] = None):
+        """记录进入等待队列的时间"""
+        self.enqueued_at = when or time.time()
+
+    def mark_dispatched(self):
+        """记录被工作线程领取，开始新的一次尝试"""
+        now = time.time()
+        self.queue_wait += max(0.0, now - self.enqueued_at)
+        self.dispatched_at = now
+        self.metadata_at = None
+        self.first_byte_at = None
+        self.network_end_at = None
+        self.attempt_bytes = 0
+        self._window_start = now
+        self._window_bytes = 0
+
+    def mark_stage(self, stage: str):
+        """
+        下载器报告的阶段事件
+
+        Args:
+            stage: 阶段名称，metadata表示元数据解析完成
+        """
+        if stage == "metadata" and self.metadata_at is None:
+            self.metadata_at = time.time()
+
+    def add_bytes(self, nbytes: int):
+        """记录收到的字节，在下载器的进度回调中调用"""
+        now = time.time()
+        if self.first_byte_at is None:
+            self.first_byte_at = now
+        self.bytes_received += nbytes
+        self.attempt_bytes += nbytes
+        self._window_bytes += nbytes
+
+        elapsed = now - self._window_start
+        if elapsed >= PEAK_WINDOW:
+            self.peak_speed = max(self.peak_speed, self._window_bytes / elapsed)
+            self._window_start = now
+            self._window_bytes = 0
+
+    def mark_network_end(self):
+        """记录网络阶段结束"""
+        self.network_end_at = time.time()
+        # 不足一个采样窗口的短任务，用整体速度作为峰值
+        if self.peak_speed == 0.0 and self.attempt_bytes:
+            self.peak_speed = self.avg_speed or 0.0
+
+    def mark_merge_start(self):
+        """记录开始合并"""
+        self.merge_start_at = time.time()
+
+    def mark_merge_end(self):
+        """记录合并结束"""
+        self.merge_end_at = time.time()
+
+    @staticmethod
+    def _span(start: Optional[float], end: Optional[float]) -> Optional[float]:
+        if start is None or end is None:
+            return None
+        return max(0.0, end - start)
+
+    @property
+    def metadata_latency(self) -> Optional[float]:
+        return self._span(self.dispatched_at, self.metadata_at)
+
+    @property
+    def ttfb(self) -> Optional[float]:
+        return self._span(self.dispatched_at, self.first_byte_at)
+
+    @property
+    def network_time(self) -> Optional[float]:
+        return self._span(self.dispatched_at, self.network_end_at)
+
+    @property
+    def merge_time(self) -> Optional[float]:
+        return self._span(self.merge_start_at, self.merge_end_at)
+
+    @property
+    def avg_speed(self) -> Optional[float]:
+        """本次尝试从首字节到网络阶段结束的平均速度（字节/秒）"""
+        span = self._span(self.first_byte_at, self.network_end_at)
+        if not span:
+            return None
+        return self.attempt_bytes / span
+
+    def to_dict(self, retries: int = 0) -> Dict:
+        """
+        导出指标
+
+        Args:
+            retries: 任务的重试次数
+
+        Returns:
+            Dict: 指标名称 -> 数值，未发生的阶段为None
+        """
+        return {
+            "queue_wait": self.queue_wait,
+            "metadata_latency": self.metadata_latency,
+            "ttfb": self.ttfb,
+            "network_time": self.network_time,
+            "avg_speed": self.avg_speed,
+            "peak_speed": self.peak_speed or None,
+            "merge_time": self.merge_time,
+            "bytes_received": self.bytes_received,
+            "bytes_written": self.bytes_written,
+            "retries": retries
+        }
+
+class _Summary:
+    """单个指标的汇总"""
+
+    __slots__ = ("count", "total", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max
+        }
+
+class MetricsAggregator:
+    """汇总已结束任务的指标"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._summaries = {name: _Summary() for name in SUMMARY_METRICS}
+        self._outcomes: Dict[str, int] = {}
+
+    def add(self, status: str, metrics: Dict):
+        """
+        累加一个已结束任务的指标
+
+        Args:
+            status: 任务的结束状态
+            metrics: TaskMetrics.to_dict导出的指标
+        """
+        with self.lock:
+            self._outcomes[status] = self._outcomes.get(status, 0) + 1
+            for name, summary in self._summaries.items():
+                value = metrics.get(name)
+                if value is not None:
+                    summary.add(value)
+
+    def to_dict(self) -> Dict:
+        """导出汇总: 各结束状态的任务数和每个指标的count/avg/min/max"""
+        with self.lock:
+            return {
+                "finished": dict(self._outcomes),
+                "metrics": {name: summary.to_dict() for name, summary in self._summaries.items()}
+            }
@@ -0,0 +1,90 @@
+"""
+熔断器与下载管理器重试的回归测试
+
+运行: 在bilibiliDownloader目录下执行 python -m unittest discover tests
+"""
+import os
+import sys
+import threading
+import time
+import types
+import unittest
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from error_handler import HTTPStatusError
+
+class StubDownloader:
+    """按outcomes依次返回结果的下载器，元素为异常时抛出"""
+
+    outcomes = []
+    lock = threading.Lock()
+
+    def __init__(self, progress_callback=None):
+        self.progress_callback = progress_callback
+
+    def download_video(self, url, save_dir, quality):
+        with StubDownloader.lock:
+            outcome = StubDownloader.outcomes.pop(0) if StubDownloader.outcomes else None
+        if isinstance(outcome, Exception):
+            raise outcome
+        return {"save_path": None, "url": url}
+
+    def stop_download(self):
+        pass
+
+# 下载器工厂导入downloader.VideoDownloader，测试中替换为桩
+sys.modules.setdefault("downloader", types.ModuleType("downloader")).VideoDownloader = StubDownloader
+
+import download_manager as dm
+from circuit_breaker import CircuitBreaker
+
+def throttled(status: int, host: str) -> HTTPStatusError:
+    return HTTPStatusError(f"{status} Client Error for url: https://{host}/stream.m4s", status)
+
+def not_found(host: str) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = 404
+    response.url = f"https://{host}/stream.m4s"
+    return requests.HTTPError(f"404 Client Error: Not Found for url: {response.url}", response=response)
+
+class BreakerRetryTest(unittest.TestCase):
+    """任务失败和重试时熔断器的状态"""
+
+    def setUp(self):
+        self.manager = dm.DownloadManager(max_concurrent=1, max_retries=10, retry_delay=0.01, max_retry_delay=0.05)
+        self.manager.circuit_breaker = CircuitBreaker(failure_threshold=3, cooldown=0.2, probe_interval=0.05)
+
+    def tearDown(self):
+        self.manager.shutdown()
+
+    def wait_status(self, task_id: str, timeout: float = 5.0) -> str:
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            status = self.manager.get_task(task_id).status
+            if status in ("completed", "failed", "canceled"):
+                return status
+            time.sleep(0.02)
+        return self.manager.get_task(task_id).status
+
+    def test_probe_throttled_by_other_host_is_released(self):
+        # CDN节点连续3次403后熔断，冷却结束后的探测任务被接口412限流，之后应继续派发并完成
+        StubDownloader.outcomes = [throttled(403, "cdn.example.com")] * 3 + [throttled(412, "api.bilibili.com")]
+        task_id = self.manager.add_task("https://www.bilibili.com/video/BV1xx411c7mD", "downloads", "high", dedupe=False)
+
+        self.assertEqual(self.wait_status(task_id), "completed")
+        self.assertEqual(StubDownloader.outcomes, [])
+        self.assertEqual(self.manager.circuit_breaker.retry_after(), 0)
+
+    def test_unrelated_failure_keeps_throttle_count(self):
+        # 其他主机的404不应清零CDN节点的连续403次数
+        StubDownloader.outcomes = [throttled(403, "cdn.example.com")] * 2 + [not_found("other.example.com")]
+        task_id = self.manager.add_task("https://www.bilibili.com/video/BV1xx411c7mD", "downloads", "high", dedupe=False)
+
+        self.assertEqual(self.wait_status(task_id), "failed")
+        self.assertEqual(self.manager.circuit_breaker._hosts["cdn.example.com"].failures, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,9 +10,8 @@ import string
 import time
 from datetime import datetime
 
-import requests
-
 from config import HISTORY_FILE
+from http_session import get_session
 
 
 def ensure_dir(directory):
@@ -49,8 +48,7 @@ def extract_video_id(url):
     # 短链接处理
     if 'b23.tv' in url:
         try:
-            import requests
-            response = requests.head(url, allow_redirects=True)
+            response = get_session().head(url, allow_redirects=True, timeout=10)
             return extract_video_id(response.url)
         except:
             pass
@@ -138,9 +136,8 @@ def get_system_info():
 
 def test_network():
     """测试网络连接"""
-    import requests
     try:
-        response = requests.get("https://www.bilibili.com", timeout=5)
+        response = get_session().get("https://www.bilibili.com", timeout=5)
         return response.status_code == 200
     except:
         return False
@@ -159,7 +156,7 @@ def profile_function(func):
 def get_file_size(url: str) -> int:
     """获取远程文件大小"""
     try:
-        response = requests.head(url)
+        response = get_session().head(url, allow_redirects=True, timeout=10)
         response.raise_for_status()
         content_length = int(response.headers.get('content-length', 0))
         return content_length